@@ -0,0 +1,72 @@
+"""
+FastCORS 中间件微基准测试
+
+使用方法:
+    python backend/benchmarks/bench_cors.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend.middleware.cors_asgi import FastCORS
+
+
+ORIGIN = b"http://localhost:3000"
+ITERATIONS = 100_000
+
+
+async def dummy_app(scope, receive, send):
+    """最小下游应用: 返回空的 200 响应"""
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def noop_send(message):
+    pass
+
+
+async def bench(name: str, middleware: FastCORS, scope: dict):
+    """重复调用中间件并输出每次调用的平均耗时"""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await middleware(scope, None, noop_send)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {elapsed / ITERATIONS * 1e6:.2f} µs/call")
+
+
+async def main():
+    middleware = FastCORS(
+        dummy_app,
+        allow_origins=[ORIGIN.decode()],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    simple_scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"origin", ORIGIN), (b"accept", b"application/json")],
+    }
+    preflight_scope = {
+        "type": "http",
+        "method": "OPTIONS",
+        "headers": [
+            (b"origin", ORIGIN),
+            (b"access-control-request-method", b"POST"),
+            (b"access-control-request-headers", b"content-type"),
+        ],
+    }
+
+    print(f"FastCORS 微基准 ({ITERATIONS} 次调用)")
+    await bench("simple", middleware, simple_scope)
+    await bench("preflight", middleware, preflight_scope)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
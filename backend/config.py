@@ -15,12 +15,18 @@ class Settings(BaseSettings):
     llm_model_name: str
 
     # ===== Database =====
-    database_url: str = "sqlite:///./data.db"
+    database_url: str = "sqlite+aiosqlite:///./data.db"
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30  # 秒
+    db_pool_recycle: int = 3600  # 秒
+    auto_create_tables: bool = True  # 由迁移工具管理表结构时设为 False
 
     # ===== App Settings =====
     debug: bool = False
     upload_dir: str = "./backend/uploads"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    analyzer_backend: str = "duckdb"  # "polars": CSV/Parquet 统计改用 Polars 惰性扫描（需安装 polars）
 
     # ===== CORS =====
     allowed_origins: List[str] = [
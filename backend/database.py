@@ -1,30 +1,65 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from backend.config import get_settings
 
 settings = get_settings()
 
-# 创建数据库引擎
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+
+def _to_async_url(database_url: str) -> str:
+    """
+    将同步数据库URL转换为异步驱动URL
+    sqlite:// -> sqlite+aiosqlite://, postgresql:// -> postgresql+asyncpg://
+    已指定驱动的URL保持不变
+    """
+    if database_url.startswith("sqlite://"):
+        return database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if database_url.startswith("postgresql://"):
+        return database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return database_url
+
+
+def _engine_kwargs(database_url: str) -> dict:
+    """
+    根据数据库类型构建连接池参数
+    SQLite 为本地文件,不需要连接池容量配置;其他数据库显式配置 QueuePool
+    """
+    kwargs = {
+        "pool_pre_ping": True,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+    if "sqlite" in database_url:
+        kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        kwargs.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+    return kwargs
+
+
+# 创建异步数据库引擎
+engine = create_async_engine(
+    _to_async_url(settings.database_url),
+    **_engine_kwargs(settings.database_url)
 )
 
-# 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 创建异步会话工厂
+SessionLocal = async_sessionmaker(
+    engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 # 创建基类
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """
     获取数据库会话的依赖函数
     用于 FastAPI 的依赖注入
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,26 +1,86 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+import logging
+import queue
+import orjson
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from backend.config import get_settings
 from backend.database import engine, Base
+from backend.models.migrations import upgrade_schema
 from backend.routers import upload, charts, chat
+from backend.middleware import FastCORS, BodySizeLimit
+from backend.utils.llm_client import close_http_client
 
 
 # 获取配置实例
 settings = get_settings()
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+
+def configure_logging() -> QueueListener:
+    """
+    配置根日志器
+    日志记录通过 QueueHandler 入队,由后台线程写出,请求路径上不做同步 I/O
+    后台线程随应用生命周期启动和停止,启动前的日志暂存在队列中
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG if settings.debug else logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+
+    return QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+
+log_listener = configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期
+    启动时按需创建数据库表并补齐已有表缺少的列（异步引擎需通过 run_sync 执行 DDL）,
+    创建上传目录,
+    关闭时释放 LLM HTTP 客户端和数据库连接池
+    """
+    log_listener.start()
+    if settings.auto_create_tables:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
+    upload.ensure_upload_dir()
+    yield
+    await close_http_client()
+    await engine.dispose()
+    log_listener.stop()
+
 
 # 创建 FastAPI 应用
-app = FastAPI(title="数据分析 Agent", debug=settings.debug)
+app = FastAPI(
+    title="数据分析 Agent",
+    debug=settings.debug,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
+
+
+# 限制请求体大小 (预留 1MB 给 multipart 表单开销)
+# 先于 CORS 添加,位于 CORS 内层,413 响应也会带上 CORS 头
+app.add_middleware(
+    BodySizeLimit,
+    max_bytes=settings.max_file_size + 1024 * 1024,
+)
 
 # 配置 CORS
 app.add_middleware(
-    CORSMiddleware,
+    FastCORS,
     allow_origins=settings.allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 注册路由
@@ -29,22 +89,30 @@ app.include_router(charts.router)
 app.include_router(chat.router)
 
 
+# 预先序列化固定的响应内容,请求时直接返回字节
+_ROOT_BODY = orjson.dumps({
+    "message": "Hello! 数据分析 Agent 启动成功！",
+    "debug": settings.debug,
+    "upload_dir": settings.upload_dir
+})
+
+# /settings 的静态部分 (去掉末尾的 "}",请求时拼接连接池状态)
+_SETTINGS_BODY_PREFIX = orjson.dumps({
+    "LLM_api_key": bool(settings.llm_api_key != "your_api_key_here"),  # 检查LLM_api_key是否为空
+    "database_url": settings.database_url,
+    "upload_dir": settings.upload_dir,
+    "max_file_size": settings.max_file_size,
+    "allowed_origins": settings.allowed_origins
+})[:-1]
+
+
 # 定义一个测试接口
 @app.get("/")
-def read_root():
-    return {
-        "message": "Hello! 数据分析 Agent 启动成功！",
-        "debug": settings.debug,
-        "upload_dir": settings.upload_dir
-    }
+async def read_root():
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/settings")
-def read_settings():
-    return {
-        "LLM_api_key": bool(settings.llm_api_key != "your_api_key_here"),  # 检查LLM_api_key是否为空
-        "database_url": settings.database_url,
-        "upload_dir": settings.upload_dir,
-        "max_file_size": settings.max_file_size,
-        "allowed_origins": settings.allowed_origins
-    }
+async def read_settings():
+    body = _SETTINGS_BODY_PREFIX + b',"db_pool_status":' + orjson.dumps(engine.pool.status()) + b"}"
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,5 @@
+# middleware package
+from backend.middleware.cors_asgi import FastCORS
+from backend.middleware.body_limit import BodySizeLimit
+
+__all__ = ["FastCORS", "BodySizeLimit"]
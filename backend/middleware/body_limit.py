@@ -0,0 +1,102 @@
+"""
+纯 ASGI 实现的请求体大小限制中间件
+在读取请求体之前根据 Content-Length 拒绝超大请求
+"""
+
+
+class _BodyTooLarge(Exception):
+    """分块传输的请求体超过限制"""
+
+
+class BodySizeLimit:
+    """
+    请求体大小限制中间件
+
+    - 带 Content-Length 的请求: 超限时直接返回 413,不读取请求体
+    - 分块传输的请求: 边读取边计数,超限时中断并返回 413;
+      下游已把超限异常转换成其他响应时,以 413 替换
+
+    需注册在 CORS 中间件内层 (先于 FastCORS 添加),413 响应才会带上 CORS 头
+    """
+
+    def __init__(self, app, max_bytes: int):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游 ASGI 应用
+            max_bytes: 允许的最大请求体字节数
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+
+        self._body = f'{{"detail":"Request body exceeds {max_bytes} bytes"}}'.encode("utf-8")
+        self._start_message = {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(self._body)).encode("latin-1")),
+                (b"connection", b"close"),
+            ],
+        }
+
+    async def reject(self, send):
+        """发送预构建的 413 响应 (外层中间件会改写 headers,每次发送浅拷贝)"""
+        await send(dict(self._start_message))
+        await send({"type": "http.response.body", "body": self._body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    break
+                if content_length > self.max_bytes:
+                    await self.reject(send)
+                    return
+                # 长度已知且未超限,无需逐块计数
+                await self.app(scope, receive, send)
+                return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def receive_wrapper():
+            nonlocal received, too_large
+            if too_large:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if too_large:
+                # 下游 (请求体解析、ServerErrorMiddleware) 可能把超限异常转换成 400/500 响应,
+                # 丢弃下游的响应,改为发送 413
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self.reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if not too_large:
+                raise
+            if not response_started:
+                await self.reject(send)
@@ -0,0 +1,153 @@
+"""
+纯 ASGI 实现的 CORS 中间件
+直接操作 scope/send,不构造 Request/Response 对象
+"""
+
+from typing import Sequence
+
+
+ALL_METHODS = ("DELETE", "GET", "HEAD", "OPTIONS", "PATCH", "POST", "PUT")
+
+
+class FastCORS:
+    """
+    CORS 中间件
+
+    - 预检请求 (OPTIONS + Access-Control-Request-Method) 直接在中间件内响应
+    - 普通请求通过包装 send,在 http.response.start 时注入 CORS 响应头
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origins: Sequence[str] = (),
+        allow_methods: Sequence[str] = ("GET",),
+        allow_headers: Sequence[str] = (),
+        allow_credentials: bool = False,
+        expose_headers: Sequence[str] = (),
+        max_age: int = 600,
+    ):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游 ASGI 应用
+            allow_origins: 允许的来源列表 ("*" 表示全部)
+            allow_methods: 允许的方法列表 ("*" 表示全部)
+            allow_headers: 允许的请求头列表 ("*" 表示全部)
+            allow_credentials: 是否允许携带凭证
+            expose_headers: 暴露给浏览器的响应头
+            max_age: 预检结果缓存时间(秒)
+        """
+        self.app = app
+
+        self.allow_all_origins = "*" in allow_origins
+        self.allow_origins = frozenset(o.encode("latin-1") for o in allow_origins)
+
+        self.allow_all_methods = "*" in allow_methods
+        self.allow_methods = ALL_METHODS if self.allow_all_methods else tuple(m.upper() for m in allow_methods)
+
+        self.allow_all_headers = "*" in allow_headers
+        self.allow_headers = frozenset(h.lower() for h in allow_headers)
+
+        self.allow_credentials = allow_credentials
+        self.expose_headers = tuple(expose_headers)
+        self.max_age = max_age
+
+        # 预先拼接并编码响应头,避免每个响应重复 join/encode
+        self._allow_methods_b = ", ".join(self.allow_methods).encode("latin-1")
+        self._allow_headers_b = ", ".join(sorted(self.allow_headers)).encode("latin-1")
+        self._expose_headers_b = ", ".join(self.expose_headers).encode("latin-1")
+        self._max_age_b = str(max_age).encode("latin-1")
+
+    def is_allowed_origin(self, origin: bytes) -> bool:
+        """检查来源是否允许"""
+        return self.allow_all_origins or origin in self.allow_origins
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        request_method = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self.preflight_response(origin, request_method, request_headers, send)
+            return
+
+        await self.simple_response(scope, receive, send, origin)
+
+    async def preflight_response(self, origin: bytes, request_method: bytes, request_headers, send):
+        """直接响应预检请求,不进入下游应用"""
+        headers = [
+            (b"access-control-allow-methods", self._allow_methods_b),
+            (b"access-control-max-age", self._max_age_b),
+            (b"vary", b"Origin"),
+        ]
+        if self.allow_credentials:
+            headers.append((b"access-control-allow-credentials", b"true"))
+
+        failures = []
+        if self.is_allowed_origin(origin):
+            headers.append((b"access-control-allow-origin", origin))
+        else:
+            failures.append("origin")
+
+        if request_method.decode("latin-1").upper() not in self.allow_methods:
+            failures.append("method")
+
+        if request_headers is not None:
+            if self.allow_all_headers:
+                headers.append((b"access-control-allow-headers", request_headers))
+            else:
+                requested = {h.strip().lower() for h in request_headers.decode("latin-1").split(",") if h.strip()}
+                if not requested <= self.allow_headers:
+                    failures.append("headers")
+                elif self.allow_headers:
+                    headers.append((b"access-control-allow-headers", self._allow_headers_b))
+
+        if failures:
+            status, body = 400, ("Disallowed CORS " + ", ".join(failures)).encode("utf-8")
+        else:
+            status, body = 200, b"OK"
+        headers.append((b"content-type", b"text/plain; charset=utf-8"))
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def simple_response(self, scope, receive, send, origin: bytes):
+        """普通请求: 在响应开始时注入 CORS 头"""
+        if not self.is_allowed_origin(origin):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if self.allow_all_origins and not self.allow_credentials:
+                    headers.append((b"access-control-allow-origin", b"*"))
+                else:
+                    headers.append((b"access-control-allow-origin", origin))
+                    headers.append((b"vary", b"Origin"))
+                if self.allow_credentials:
+                    headers.append((b"access-control-allow-credentials", b"true"))
+                if self._expose_headers_b:
+                    headers.append((b"access-control-expose-headers", self._expose_headers_b))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
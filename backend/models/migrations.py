@@ -0,0 +1,66 @@
+"""
+数据库表结构升级
+create_all 只创建缺失的表,不会修改已存在的表;
+后续版本新增的列和索引在这里补到已有数据库上,每一步都可重复执行
+"""
+
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from backend.database import Base
+
+logger = logging.getLogger(__name__)
+
+
+# 后续版本新增的列: (表名, 列名, 默认值, 回填语句)
+# NOT NULL 列需带默认值才能加到已有行上;回填语句只在列刚添加时执行
+ADDED_COLUMNS = (
+    ("datasets", "parquet_path", None, None),
+    ("datasets", "content_hash", None, None),
+    (
+        "analyses", "category", "chart",
+        "UPDATE analyses SET category = 'chart' WHERE analysis_type LIKE 'chart_%'",
+    ),
+)
+
+
+def upgrade_schema(conn: Connection) -> None:
+    """
+    为已有数据库补齐缺少的列和索引并回填新列
+    需在 create_all 之后执行 (异步引擎通过 run_sync 调用)
+
+    Args:
+        conn: 同步数据库连接
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    existing_columns = {}
+
+    for table_name, column_name, default, backfill in ADDED_COLUMNS:
+        if table_name not in existing_columns:
+            existing_columns[table_name] = {
+                column["name"] for column in inspector.get_columns(table_name)
+            }
+        if column_name in existing_columns[table_name]:
+            continue
+
+        table = Base.metadata.tables[table_name]
+        column = table.c[column_name]
+        ddl = (
+            f"ALTER TABLE {preparer.format_table(table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}"
+        )
+        if default is not None:
+            ddl += " NOT NULL DEFAULT '" + default.replace("'", "''") + "'"
+        conn.execute(text(ddl))
+        if backfill is not None:
+            conn.execute(text(backfill))
+        existing_columns[table_name].add(column_name)
+        logger.info("已为表 %s 添加列 %s", table_name, column_name)
+
+    # create_all 不会给已存在的表建索引 (包括复合索引),按名称补建缺少的
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
@@ -1,21 +1,36 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from backend.database import Base
 
 
+def _utcnow() -> datetime:
+    """
+    时间戳列的默认值
+    在应用侧生成带时区的 UTC 时间,保留微秒精度;
+    SQLite 的 CURRENT_TIMESTAMP 只精确到秒且不带时区,同一秒内的记录按创建时间排序时次序不确定
+    """
+    return datetime.now(timezone.utc)
+
+
 class Dataset(Base):
     """数据集表"""
     __tablename__ = "datasets"
+    __table_args__ = (
+        # list_datasets: 按状态过滤,按 (创建时间, ID) 倒序 (游标分页)
+        Index("ix_datasets_status_created", "status", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
 
     file_path = Column(String(255), nullable=False)
+    parquet_path = Column(String(255), nullable=True)  # 上传时转换的 Parquet 文件,原文件即 Parquet 时为空
     original_filename = Column(String(255), nullable=False)
     file_size = Column(Integer, nullable=False)
     file_type = Column(String(50), nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)  # 文件内容 SHA-256,用于识别重复上传
 
     schema_json = Column(JSON, nullable=True)
     row_count = Column(Integer, default=0)
@@ -23,12 +38,17 @@ class Dataset(Base):
     tags = Column(JSON, nullable=True)
     status = Column(String(20), default="active")
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime(timezone=True), default=_utcnow)
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
 
     analyses = relationship("Analysis", back_populates="dataset", cascade="all, delete-orphan")
     chat_sessions = relationship("ChatSession", back_populates="dataset", cascade="all, delete-orphan")
 
+    @property
+    def query_path(self) -> str:
+        """查询时读取的文件路径: 优先使用转换后的 Parquet"""
+        return self.parquet_path or self.file_path
+
     def __repr__(self):
         return f"<Dataset(id={self.id}, name={self.name})>"
 
@@ -36,10 +56,15 @@ class Dataset(Base):
 class Analysis(Base):
     """分析任务表"""
     __tablename__ = "analyses"
+    __table_args__ = (
+        # list_charts / get_chart: 按数据集和类别过滤,按创建时间倒序
+        Index("ix_analyses_dataset_category_created", "dataset_id", "category", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False)
 
+    category = Column(String(16), nullable=False, default="chart")  # chart | query | insight
     analysis_type = Column(String(50), nullable=False)
     title = Column(String(255), nullable=True)
     description = Column(Text, nullable=True)
@@ -55,8 +80,8 @@ class Analysis(Base):
     is_cached = Column(Boolean, default=False)
     access_count = Column(Integer, default=0)
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime(timezone=True), default=_utcnow)
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
 
     dataset = relationship("Dataset", back_populates="analyses")
     chat_sessions = relationship("ChatSession", back_populates="analysis")
@@ -68,6 +93,10 @@ class Analysis(Base):
 class ChatSession(Base):
     """对话会话表"""
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # get_chat_history: 按数据集过滤,按创建时间倒序分页
+        Index("ix_chat_sessions_dataset_created", "dataset_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False)
@@ -81,7 +110,7 @@ class ChatSession(Base):
     message_type = Column(String(50), default="text")
     tokens_used = Column(Integer, nullable=True)
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime(timezone=True), default=_utcnow)
 
     dataset = relationship("Dataset", back_populates="chat_sessions")
     analysis = relationship("Analysis", back_populates="chat_sessions")
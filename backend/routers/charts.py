@@ -3,16 +3,26 @@ Charts API Router
 Provides endpoints for generating various chart types
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
-from typing import List, Optional, Any, Dict
+from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Callable, List, Literal, Optional, Any, Dict, Union
 from datetime import datetime
+import asyncio
+import orjson
 
-from backend.database import get_db
+from backend.database import get_db, SessionLocal
 from backend.models.models import Dataset, Analysis
-from backend.utils.charts import generate_chart
-import os
+from backend.utils.charts import (
+    bar_chart_duckdb,
+    timeseries_chart_duckdb,
+    pie_chart_duckdb,
+    distribution_chart_duckdb,
+    heatmap_chart_duckdb
+)
+from backend.utils.file_cache import file_exists
 
 router = APIRouter(prefix="/datasets/{dataset_id}/charts", tags=["charts"])
 
@@ -20,13 +30,15 @@ router = APIRouter(prefix="/datasets/{dataset_id}/charts", tags=["charts"])
 # Request schemas
 class ChartRequest(BaseModel):
     """Base chart generation request"""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     chart_type: str = Field(..., description="Chart type: bar|timeseries|pie|distribution|heatmap")
     title: Optional[str] = Field(None, description="Chart title")
 
 
 class BarChartRequest(ChartRequest):
     """Bar chart specific parameters"""
-    chart_type: str = "bar"
+    chart_type: Literal["bar"] = "bar"
     category_col: str = Field(..., description="Category column name")
     value_col: str = Field(default="count", description="Value column name or 'count'")
     agg: str = Field(default="sum", description="Aggregation method: sum|count|mean|median")
@@ -35,7 +47,7 @@ class BarChartRequest(ChartRequest):
 
 class TimeseriesChartRequest(ChartRequest):
     """Timeseries chart specific parameters"""
-    chart_type: str = "timeseries"
+    chart_type: Literal["timeseries"] = "timeseries"
     time_col: str = Field(..., description="Time column name")
     value_col: str = Field(default="count", description="Value column name or 'count'")
     freq: str = Field(default="D", description="Frequency: D|W|M")
@@ -46,7 +58,7 @@ class TimeseriesChartRequest(ChartRequest):
 
 class PieChartRequest(ChartRequest):
     """Pie chart specific parameters"""
-    chart_type: str = "pie"
+    chart_type: Literal["pie"] = "pie"
     category_col: str = Field(..., description="Category column name")
     value_col: str = Field(default="count", description="Value column name or 'count'")
     agg: str = Field(default="sum", description="Aggregation method: sum|count|mean|median")
@@ -55,17 +67,93 @@ class PieChartRequest(ChartRequest):
 
 class DistributionChartRequest(ChartRequest):
     """Distribution chart specific parameters"""
-    chart_type: str = "distribution"
+    chart_type: Literal["distribution"] = "distribution"
     value_col: str = Field(..., description="Value column name")
     bins: Optional[int] = Field(None, description="Number of bins (auto if None)")
 
 
 class HeatmapChartRequest(ChartRequest):
     """Heatmap chart specific parameters"""
-    chart_type: str = "heatmap"
+    chart_type: Literal["heatmap"] = "heatmap"
     columns: Optional[List[str]] = Field(None, description="Numeric columns (auto-select if None)")
 
 
+# Request body for create_chart: validated against the model selected by chart_type
+ChartRequestUnion = Annotated[
+    Union[
+        BarChartRequest,
+        TimeseriesChartRequest,
+        PieChartRequest,
+        DistributionChartRequest,
+        HeatmapChartRequest
+    ],
+    Body(discriminator="chart_type")
+]
+
+
+# Chart handlers: map a validated request model onto its generator
+def _bar_chart(file_path: str, req: BarChartRequest) -> Dict[str, Any]:
+    return bar_chart_duckdb(
+        file_path,
+        category_col=req.category_col,
+        value_col=req.value_col,
+        agg=req.agg,
+        top_k=req.top_k,
+        title=req.title
+    )
+
+
+def _timeseries_chart(file_path: str, req: TimeseriesChartRequest) -> Dict[str, Any]:
+    return timeseries_chart_duckdb(
+        file_path,
+        time_col=req.time_col,
+        value_col=req.value_col,
+        freq=req.freq,
+        agg=req.agg,
+        group_by=req.group_by,
+        time_range=req.time_range,
+        title=req.title
+    )
+
+
+def _pie_chart(file_path: str, req: PieChartRequest) -> Dict[str, Any]:
+    return pie_chart_duckdb(
+        file_path,
+        category_col=req.category_col,
+        value_col=req.value_col,
+        agg=req.agg,
+        top_k=req.top_k,
+        title=req.title
+    )
+
+
+def _distribution_chart(file_path: str, req: DistributionChartRequest) -> Dict[str, Any]:
+    return distribution_chart_duckdb(
+        file_path,
+        value_col=req.value_col,
+        bins=req.bins,
+        title=req.title
+    )
+
+
+def _heatmap_chart(file_path: str, req: HeatmapChartRequest) -> Dict[str, Any]:
+    return heatmap_chart_duckdb(
+        file_path,
+        columns=req.columns,
+        title=req.title
+    )
+
+
+# Chart generators run in worker threads: DuckDB releases the GIL while executing queries
+_CHART_HANDLERS: Dict[str, Callable[[str, Any], Dict[str, Any]]] = {
+    "bar": _bar_chart,
+    "timeseries": _timeseries_chart,
+    "pie": _pie_chart,
+    "distribution": _distribution_chart,
+    "heatmap": _heatmap_chart
+}
+
+
 # Response schema
 class ChartResponse(BaseModel):
     """Chart generation response"""
@@ -76,15 +164,14 @@ class ChartResponse(BaseModel):
     meta: Dict[str, Any]
     summary: Dict[str, Any]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="forbid", frozen=True)
 
 
 @router.post("", response_model=ChartResponse, summary="Generate chart")
 async def create_chart(
     dataset_id: int,
-    request: Dict[str, Any],
-    db: Session = Depends(get_db)
+    request: ChartRequestUnion,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Generate a chart for a dataset
@@ -98,55 +185,50 @@ async def create_chart(
 
     Args:
         dataset_id: Dataset ID
-        request: Chart configuration (type and parameters)
+        request: Chart configuration, validated by the model matching chart_type
         db: Database session
 
     Returns:
         Chart configuration with Plotly JSON spec
 
     Raises:
-        HTTPException: If dataset not found or chart generation fails
+        HTTPException: If dataset not found, not yet analyzed (409) or chart generation fails
     """
     # Get dataset
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
+    # Analysis of background uploads must finish before the data can be charted
+    if dataset.status != "active":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+
     # Check if file exists
-    if not os.path.exists(dataset.file_path):
+    if not await file_exists(dataset.query_path):
         raise HTTPException(status_code=404, detail="Dataset file not found")
 
-    # Extract chart type
-    chart_type = request.get("chart_type")
-    if not chart_type:
-        raise HTTPException(status_code=400, detail="chart_type is required")
-
-    # Remove chart_type from kwargs to pass to generator
-    chart_params = {k: v for k, v in request.items() if k != "chart_type"}
+    chart_type = request.chart_type
+    handler = _CHART_HANDLERS[chart_type]
 
     try:
         # Generate chart
         start_time = datetime.now()
-        chart_result = generate_chart(
-            file_path=dataset.file_path,
-            chart_type=chart_type,
-            **chart_params
-        )
+        chart_result = await asyncio.to_thread(handler, dataset.query_path, request)
         execution_time = (datetime.now() - start_time).total_seconds()
 
         # Save to analyses table
         analysis = Analysis(
             dataset_id=dataset_id,
+            category="chart",
             analysis_type=f"chart_{chart_type}",
-            title=chart_params.get("title", f"{chart_type.capitalize()} Chart"),
-            input_params=request,
+            title=request.title or f"{chart_type.capitalize()} Chart",
+            input_params=request.model_dump(exclude_unset=True),
             result_json=chart_result,
             execution_time=execution_time,
             status="completed"
         )
         db.add(analysis)
-        db.commit()
-        db.refresh(analysis)
+        await db.commit()
 
         return chart_result
 
@@ -161,7 +243,7 @@ async def list_charts(
     dataset_id: int,
     chart_type: Optional[str] = None,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     List all charts generated for a dataset
@@ -176,43 +258,58 @@ async def list_charts(
         List of chart analyses
     """
     # Check dataset exists
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
-    # Build query
-    query = db.query(Analysis).filter(
+    # Build query (project only the listed fields; the full Plotly spec in result_json stays in the DB)
+    stmt = select(
+        Analysis.id,
+        Analysis.analysis_type,
+        Analysis.title,
+        Analysis.created_at,
+        Analysis.execution_time,
+        Analysis.result_json["summary"].label("summary")
+    ).where(
         Analysis.dataset_id == dataset_id,
-        Analysis.analysis_type.like("chart_%")
+        Analysis.category == "chart"
     )
 
     if chart_type:
-        query = query.filter(Analysis.analysis_type == f"chart_{chart_type}")
-
-    analyses = query.order_by(Analysis.created_at.desc()).limit(limit).all()
-
-    return {
-        "dataset_id": dataset_id,
-        "total": len(analyses),
-        "charts": [
-            {
-                "id": a.id,
-                "chart_type": a.analysis_type.replace("chart_", ""),
-                "title": a.title,
-                "created_at": a.created_at,
-                "execution_time": a.execution_time,
-                "summary": a.result_json.get("summary") if a.result_json else None
-            }
-            for a in analyses
-        ]
-    }
+        stmt = stmt.where(Analysis.analysis_type == f"chart_{chart_type}")
+
+    stmt = stmt.order_by(Analysis.created_at.desc()).limit(limit)
+
+    async def stream_charts():
+        # Encode one row at a time so peak memory stays bounded to a single chart.
+        # The body is sent after the handler returns, so the generator owns its session
+        # instead of iterating on the request-scoped one.
+        yield b'{"dataset_id":%d,"charts":[' % dataset_id
+        total = 0
+        async with SessionLocal() as session:
+            result = await session.stream(stmt)
+            async for a in result.mappings():
+                if total:
+                    yield b","
+                yield orjson.dumps({
+                    "id": a["id"],
+                    "chart_type": a["analysis_type"].replace("chart_", ""),
+                    "title": a["title"],
+                    "created_at": a["created_at"],
+                    "execution_time": a["execution_time"],
+                    "summary": a["summary"]
+                })
+                total += 1
+        yield b'],"total":%d}' % total
+
+    return StreamingResponse(stream_charts(), media_type="application/json")
 
 
 @router.get("/{analysis_id}", response_model=ChartResponse, summary="Get chart by ID")
 async def get_chart(
     dataset_id: int,
     analysis_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retrieve a specific chart by analysis ID
@@ -225,11 +322,13 @@ async def get_chart(
     Returns:
         Chart configuration
     """
-    analysis = db.query(Analysis).filter(
-        Analysis.id == analysis_id,
-        Analysis.dataset_id == dataset_id,
-        Analysis.analysis_type.like("chart_%")
-    ).first()
+    analysis = await db.scalar(
+        select(Analysis).where(
+            Analysis.id == analysis_id,
+            Analysis.dataset_id == dataset_id,
+            Analysis.category == "chart"
+        )
+    )
 
     if not analysis:
         raise HTTPException(status_code=404, detail="Chart not found")
@@ -244,7 +343,7 @@ async def get_chart(
 async def delete_chart(
     dataset_id: int,
     analysis_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a chart analysis
@@ -257,16 +356,18 @@ async def delete_chart(
     Returns:
         Success message
     """
-    analysis = db.query(Analysis).filter(
-        Analysis.id == analysis_id,
-        Analysis.dataset_id == dataset_id,
-        Analysis.analysis_type.like("chart_%")
-    ).first()
+    analysis = await db.scalar(
+        select(Analysis).where(
+            Analysis.id == analysis_id,
+            Analysis.dataset_id == dataset_id,
+            Analysis.category == "chart"
+        )
+    )
 
     if not analysis:
         raise HTTPException(status_code=404, detail="Chart not found")
 
-    db.delete(analysis)
-    db.commit()
+    await db.delete(analysis)
+    await db.commit()
 
     return {"message": "Chart deleted successfully", "id": analysis_id}
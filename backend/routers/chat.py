@@ -3,12 +3,20 @@ Chat API Router
 提供自然语言查询和SQL执行的聊天接口
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select, func, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import asyncio
 import json
+import logging
+import orjson
+from datetime import datetime, timezone
 
-from backend.database import get_db
+from backend.database import get_db, SessionLocal
 from backend.models.models import Dataset, ChatSession
 from backend.schemas.chat import (
     ChatQueryRequest,
@@ -22,16 +30,275 @@ from backend.schemas.chat import (
 )
 from backend.utils.llm_client import get_nl2sql_converter, get_query_explainer
 from backend.utils.sql_tools import SQLExecutor, SchemaRetriever
-import os
+from backend.utils.file_cache import file_exists
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
+logger = logging.getLogger(__name__)
+
+# Schema列信息缓存: (dataset_id, updated_at) -> (数值列, 所有列)
+_SCHEMA_COLUMNS_CACHE: "OrderedDict[Tuple[int, Optional[datetime]], Tuple[List[str], List[str]]]" = OrderedDict()
+_SCHEMA_COLUMNS_CACHE_SIZE = 256
+
+
+def _get_schema_columns(dataset: Dataset) -> Tuple[List[str], List[str]]:
+    """
+    获取数据集的数值列和所有列名 (带缓存)
+
+    schema_json 只在数据集更新时变化,以 (dataset_id, updated_at) 为缓存键
+
+    Args:
+        dataset: 数据集对象
+
+    Returns:
+        (数值列名列表, 所有列名列表)
+    """
+    key = (dataset.id, dataset.updated_at)
+    cached = _SCHEMA_COLUMNS_CACHE.get(key)
+    if cached is None:
+        cached = (
+            SchemaRetriever.get_numeric_columns(dataset.schema_json),
+            SchemaRetriever.get_column_names(dataset.schema_json)
+        )
+        _SCHEMA_COLUMNS_CACHE[key] = cached
+        if len(_SCHEMA_COLUMNS_CACHE) > _SCHEMA_COLUMNS_CACHE_SIZE:
+            _SCHEMA_COLUMNS_CACHE.popitem(last=False)
+    else:
+        _SCHEMA_COLUMNS_CACHE.move_to_end(key)
+    return cached
+
+
+class _ClientDisconnected(Exception):
+    """客户端在请求处理完成前断开连接"""
+
+
+# 检查客户端断开的轮询间隔(秒)
+DISCONNECT_POLL_INTERVAL = 0.2
+
+# 生成的SQL执行出错时,带着报错信息让LLM修正的最大次数
+MAX_SQL_REPAIR_ATTEMPTS = 2
+
+# 可交给LLM修正的错误 (语法、列名/表名、函数签名);安全校验失败不重试
+REPAIRABLE_SQL_ERRORS = ("Parser Error", "Binder Error", "Catalog Error")
+
+
+async def _run_unless_disconnected(http_request: Request, awaitable, on_disconnect=None):
+    """
+    执行耗时任务,期间轮询客户端连接状态
+
+    客户端断开时取消任务,避免为已放弃的请求继续消耗LLM token和SQL计算。
+    取消等待中的 asyncio 任务无法停止已在工作线程中运行的同步代码,
+    这类任务通过 on_disconnect 回调通知线程中止 (如中断DuckDB查询)
+
+    Args:
+        http_request: 当前HTTP请求
+        awaitable: 待执行的协程或Future
+        on_disconnect: 客户端断开时调用的同步回调 (可选)
+
+    Returns:
+        任务结果
+
+    Raises:
+        _ClientDisconnected: 客户端已断开
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                if on_disconnect is not None:
+                    on_disconnect()
+                raise _ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _execute_query(executor: SQLExecutor, sql: str, max_rows: int) -> Dict[str, Any]:
+    """在工作线程中执行SQL查询 (游标在同一线程中打开和关闭)"""
+    with executor:
+        return executor.execute(sql=sql, max_rows=max_rows)
+
+
+async def _execute_unless_disconnected(
+    http_request: Request,
+    file_path: str,
+    sql: str,
+    max_rows: int
+) -> Dict[str, Any]:
+    """
+    在线程中执行SQL查询,客户端断开时中断DuckDB游标上正在运行的查询
+
+    Args:
+        http_request: 当前HTTP请求
+        file_path: 数据文件路径
+        sql: SQL查询语句
+        max_rows: 最大返回行数
+
+    Returns:
+        SQLExecutor.execute 的结果
+
+    Raises:
+        _ClientDisconnected: 客户端已断开
+    """
+    executor = SQLExecutor(file_path)
+    return await _run_unless_disconnected(
+        http_request,
+        asyncio.to_thread(_execute_query, executor, sql, max_rows),
+        on_disconnect=executor.interrupt
+    )
+
+
+async def _save_chat_session(values: Dict[str, Any]) -> int:
+    """
+    在独立会话中写入一条聊天记录
+    用于响应发送后的后台任务和不受请求取消影响的写入,此时请求的数据库会话可能已关闭
+
+    Args:
+        values: ChatSession 字段值
+
+    Returns:
+        新记录的ID
+    """
+    async with SessionLocal() as session:
+        new_id = await session.scalar(insert(ChatSession).values(**values).returning(ChatSession.id))
+        await session.commit()
+        return new_id
+
+
+def _sse_event(event: str, payload: Dict[str, Any]) -> bytes:
+    """编码一条 Server-Sent Events 消息"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
+
+
+async def _generate_and_execute(
+    request: ChatQueryRequest,
+    http_request: Request,
+    dataset: Dataset
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    将问题转换为SQL并执行 (chat_query 和 chat_query_stream 共用)
+
+    语法或绑定错误交给LLM在本次请求内修正;执行失败的SQL从缓存中移除
+
+    Args:
+        request: 查询请求
+        http_request: 原始HTTP请求 (用于检测客户端断开)
+        dataset: 数据集
+
+    Returns:
+        (最终执行的SQL, SQLExecutor.execute 的结果)
+
+    Raises:
+        HTTPException: 数据文件不存在
+        _ClientDisconnected: 客户端已断开
+    """
+    # 转换自然语言为SQL (LLM调用与文件检查并发进行)
+    nl2sql = get_nl2sql_converter()
+    convert_task = asyncio.create_task(nl2sql.convert(
+        question=request.question,
+        schema=dataset.schema_json,
+        table_name="data"
+    ))
+
+    # 检查文件是否存在 (带缓存,未命中时在线程中执行)
+    if not await file_exists(dataset.query_path):
+        convert_task.cancel()
+        raise HTTPException(status_code=404, detail="Dataset file not found")
+
+    sql_query = await _run_unless_disconnected(http_request, convert_task)
+
+    # 执行SQL查询 (在线程中执行,不阻塞事件循环)
+    execution_result = await _execute_unless_disconnected(
+        http_request, dataset.query_path, sql_query, request.max_rows
+    )
+
+    # 语法或绑定错误在扫描数据前就会报出,把报错交给LLM在本次请求内修正
+    for _ in range(MAX_SQL_REPAIR_ATTEMPTS):
+        error = execution_result.get("error") or ""
+        if execution_result["success"] or not error.startswith(REPAIRABLE_SQL_ERRORS):
+            break
+        # 出错的SQL移出缓存,修正成功后由 repair 写入修正结果
+        nl2sql.invalidate(request.question, dataset.schema_json)
+        sql_query = await _run_unless_disconnected(http_request, nl2sql.repair(
+            question=request.question,
+            schema=dataset.schema_json,
+            sql_query=sql_query,
+            error=error,
+            table_name="data"
+        ))
+        execution_result = await _execute_unless_disconnected(
+            http_request, dataset.query_path, sql_query, request.max_rows
+        )
+
+    if not execution_result["success"]:
+        # 最终仍然失败的SQL不留在缓存中,相同问题下次重新生成
+        nl2sql.invalidate(request.question, dataset.schema_json)
+
+    return sql_query, execution_result
+
+
+def _query_failed_response(
+    request: ChatQueryRequest,
+    sql_query: str,
+    execution_result: Dict[str, Any]
+) -> ORJSONResponse:
+    """
+    SQL执行失败的 400 响应
+    失败的查询在响应发送后由后台任务写入聊天记录,400 立即返回
+    """
+    error_session = {
+        "dataset_id": request.dataset_id,
+        "role": "user",
+        "question": request.question,
+        "answer": f"Query failed: {execution_result.get('error', 'Unknown error')}",
+        "context": {
+            "sql": sql_query,
+            "error": execution_result.get("error")
+        },
+        "message_type": "error"
+    }
+    return ORJSONResponse(
+        status_code=400,
+        content={"detail": f"SQL execution failed: {execution_result.get('error')}"},
+        background=BackgroundTask(_save_chat_session, error_session)
+    )
+
+
+def _query_session_values(
+    request: ChatQueryRequest,
+    sql_query: str,
+    execution_result: Dict[str, Any],
+    explanation: Optional[str],
+    created_at: datetime
+) -> Dict[str, Any]:
+    """成功查询对应的聊天记录字段值"""
+    return {
+        "dataset_id": request.dataset_id,
+        "role": "assistant",
+        "question": request.question,
+        "answer": explanation or f"Query returned {execution_result['row_count']} rows.",
+        "context": {
+            "sql": sql_query,
+            "execution_result": {
+                "row_count": execution_result["row_count"],
+                "execution_time": execution_result["execution_time"],
+                "columns": execution_result["columns"]
+            }
+        },
+        "message_type": "query",
+        "tokens_used": None,  # TODO: 从LLM响应中获取
+        "created_at": created_at
+    }
 
 
 @router.post("/query", response_model=ChatQueryResponse, summary="Natural language query")
 async def chat_query(
     request: ChatQueryRequest,
-    db: Session = Depends(get_db)
+    http_request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     自然语言查询接口
@@ -43,97 +310,57 @@ async def chat_query(
     4. (可选)生成自然语言解释
     5. 保存到聊天会话表
 
+    客户端中途断开时取消剩余的LLM调用和SQL执行,不写入聊天记录
+
     Args:
         request: 查询请求 (question, dataset_id, etc.)
+        http_request: 原始HTTP请求 (用于检测客户端断开)
         db: 数据库会话
 
     Returns:
         ChatQueryResponse: 查询结果和解释
 
     Raises:
-        HTTPException: 数据集不存在或查询失败
+        HTTPException: 数据集不存在、尚未分析完成 (409) 或查询失败
     """
     # 1. 获取数据集
-    dataset = db.query(Dataset).filter(Dataset.id == request.dataset_id).first()
+    dataset = await db.get(Dataset, request.dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
-
-    # 检查文件是否存在
-    if not os.path.exists(dataset.file_path):
-        raise HTTPException(status_code=404, detail="Dataset file not found")
+    if dataset.status != "active":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
 
     try:
-        # 2. 转换自然语言为SQL
-        nl2sql = get_nl2sql_converter()
-        sql_query = await nl2sql.convert(
-            question=request.question,
-            schema=dataset.schema_json,
-            table_name="data"
-        )
-
-        # 3. 执行SQL查询
-        with SQLExecutor(dataset.file_path) as executor:
-            execution_result = executor.execute(
-                sql=sql_query,
-                max_rows=request.max_rows
-            )
+        # 2-3. 转换为SQL并执行
+        sql_query, execution_result = await _generate_and_execute(request, http_request, dataset)
 
         # 检查执行是否成功
         if not execution_result["success"]:
-            # 保存失败的查询到聊天记录
-            chat_session = ChatSession(
-                dataset_id=request.dataset_id,
-                role="user",
-                question=request.question,
-                answer=f"Query failed: {execution_result.get('error', 'Unknown error')}",
-                context={
-                    "sql": sql_query,
-                    "error": execution_result.get("error")
-                },
-                message_type="error"
-            )
-            db.add(chat_session)
-            db.commit()
-
-            raise HTTPException(
-                status_code=400,
-                detail=f"SQL execution failed: {execution_result.get('error')}"
-            )
+            return _query_failed_response(request, sql_query, execution_result)
 
         # 4. 生成自然语言解释 (可选)
         explanation = None
-        if request.generate_explanation and execution_result["success"]:
+        if request.generate_explanation:
             try:
                 explainer = get_query_explainer()
-                explanation = await explainer.explain_results(
+                explanation = await _run_unless_disconnected(http_request, explainer.explain_results(
                     question=request.question,
                     sql_query=sql_query,
                     results=execution_result["data"]
-                )
+                ))
+            except _ClientDisconnected:
+                raise
             except Exception as e:
                 # 解释生成失败不影响主流程
                 explanation = f"Results retrieved successfully. (Explanation generation failed: {str(e)})"
 
-        # 5. 保存到聊天会话
-        chat_session = ChatSession(
-            dataset_id=request.dataset_id,
-            role="assistant",
-            question=request.question,
-            answer=explanation or f"Query returned {execution_result['row_count']} rows.",
-            context={
-                "sql": sql_query,
-                "execution_result": {
-                    "row_count": execution_result["row_count"],
-                    "execution_time": execution_result["execution_time"],
-                    "columns": execution_result["columns"]
-                }
-            },
-            message_type="query",
-            tokens_used=None  # TODO: 从LLM响应中获取
-        )
-        db.add(chat_session)
-        db.commit()
-        db.refresh(chat_session)
+        # 5. 保存到聊天会话 (单条 INSERT ... RETURNING,单次提交)
+        created_at = datetime.now(timezone.utc)
+        session_values = _query_session_values(request, sql_query, execution_result, explanation, created_at)
+
+        # 此时工作已完成,写入不受客户端断开影响;
+        # 使用独立会话,请求取消后请求的会话可能在写入完成前被关闭
+        session_id = await asyncio.shield(_save_chat_session(session_values))
 
         # 6. 构建响应
         return ChatQueryResponse(
@@ -141,60 +368,154 @@ async def chat_query(
             sql_generated=sql_query,
             execution_result=SQLExecutionResult(**execution_result),
             explanation=explanation,
-            session_id=chat_session.id,
+            session_id=session_id,
             dataset_id=request.dataset_id,
-            created_at=chat_session.created_at
+            created_at=created_at
         )
 
     except HTTPException:
         raise
+    except _ClientDisconnected:
+        # 客户端已断开,响应不会被读取,返回空响应
+        return Response(status_code=204)
     except Exception as e:
-        # 捕获其他异常
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"Chat query error: {error_detail}")
+        # 捕获其他异常 (仅在日志级别允许时格式化堆栈)
+        logger.exception("Chat query failed")
+
+        raise HTTPException(
+            status_code=500,
+            detail=f"Query processing failed: {str(e)}"
+        )
+
+
+@router.post("/query/stream", summary="Natural language query with streamed explanation")
+async def chat_query_stream(
+    request: ChatQueryRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    自然语言查询接口 (流式返回解释)
 
+    SQL生成、执行和出错时的响应与 /chat/query 相同;执行成功后以 Server-Sent Events 返回:
+    - result: 生成的SQL和执行结果,前端收到即可渲染表格
+    - explanation: 解释的文本片段 (generate_explanation 为 True 时),LLM生成一段推送一段
+    - error: 解释生成失败的原因
+    - done: 保存的聊天记录ID和创建时间
+
+    客户端在推送过程中断开时停止LLM生成,不写入聊天记录
+
+    Args:
+        request: 查询请求 (question, dataset_id, etc.)
+        http_request: 原始HTTP请求 (用于检测客户端断开)
+        db: 数据库会话
+
+    Returns:
+        text/event-stream 响应
+
+    Raises:
+        HTTPException: 数据集不存在、尚未分析完成 (409) 或查询失败
+    """
+    dataset = await db.get(Dataset, request.dataset_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if dataset.status != "active":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+
+    try:
+        sql_query, execution_result = await _generate_and_execute(request, http_request, dataset)
+    except HTTPException:
+        raise
+    except _ClientDisconnected:
+        return Response(status_code=204)
+    except Exception as e:
+        logger.exception("Chat query failed")
         raise HTTPException(
             status_code=500,
             detail=f"Query processing failed: {str(e)}"
         )
 
+    if not execution_result["success"]:
+        return _query_failed_response(request, sql_query, execution_result)
+
+    async def event_stream():
+        # 响应体在处理函数返回后才发送,聊天记录通过 _save_chat_session 的独立会话写入
+        yield _sse_event("result", {
+            "question": request.question,
+            "sql_generated": sql_query,
+            "execution_result": execution_result,
+            "dataset_id": request.dataset_id
+        })
+
+        explanation = None
+        if request.generate_explanation:
+            parts = []
+            try:
+                explainer = get_query_explainer()
+                async for chunk in explainer.explain_results_stream(
+                    question=request.question,
+                    sql_query=sql_query,
+                    results=execution_result["data"]
+                ):
+                    parts.append(chunk)
+                    yield _sse_event("explanation", {"delta": chunk})
+                explanation = "".join(parts).strip()
+            except Exception as e:
+                # 解释生成失败不影响已返回的查询结果
+                explanation = f"Results retrieved successfully. (Explanation generation failed: {str(e)})"
+                yield _sse_event("error", {"detail": explanation})
+
+        created_at = datetime.now(timezone.utc)
+        session_id = await _save_chat_session(
+            _query_session_values(request, sql_query, execution_result, explanation, created_at)
+        )
+        yield _sse_event("done", {"session_id": session_id, "created_at": created_at})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 
 @router.post("/sql", response_model=SQLExecutionResult, summary="Direct SQL execution")
 async def execute_sql(
     request: DirectSQLRequest,
-    db: Session = Depends(get_db)
+    http_request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     直接SQL执行接口 (高级功能)
 
     允许用户直接执行SQL查询,适合高级用户
+    查询在工作线程中执行,客户端中途断开时中断查询,不写入聊天记录
 
     Args:
         request: SQL查询请求
+        http_request: 原始HTTP请求 (用于检测客户端断开)
         db: 数据库会话
 
     Returns:
         SQLExecutionResult: SQL执行结果
 
     Raises:
-        HTTPException: 数据集不存在或SQL执行失败
+        HTTPException: 数据集不存在、尚未分析完成 (409) 或SQL执行失败
     """
     # 获取数据集
-    dataset = db.query(Dataset).filter(Dataset.id == request.dataset_id).first()
+    dataset = await db.get(Dataset, request.dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
+    if dataset.status != "active":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
 
-    if not os.path.exists(dataset.file_path):
+    if not await file_exists(dataset.query_path):
         raise HTTPException(status_code=404, detail="Dataset file not found")
 
     try:
         # 执行SQL
-        with SQLExecutor(dataset.file_path) as executor:
-            execution_result = executor.execute(
-                sql=request.sql,
-                max_rows=request.max_rows
-            )
+        execution_result = await _execute_unless_disconnected(
+            http_request, dataset.query_path, request.sql, request.max_rows
+        )
 
         # 保存到聊天会话 (仅成功的查询)
         if execution_result["success"]:
@@ -213,10 +534,13 @@ async def execute_sql(
                 message_type="direct_sql"
             )
             db.add(chat_session)
-            db.commit()
+            await db.commit()
 
         return SQLExecutionResult(**execution_result)
 
+    except _ClientDisconnected:
+        # 客户端已断开,响应不会被读取,返回空响应
+        return Response(status_code=204)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -229,7 +553,7 @@ async def get_chat_history(
     dataset_id: int,
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     获取聊天历史记录
@@ -247,20 +571,33 @@ async def get_chat_history(
         HTTPException: 数据集不存在
     """
     # 检查数据集是否存在
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
     # 查询聊天记录
-    total_count = db.query(ChatSession).filter(
-        ChatSession.dataset_id == dataset_id
-    ).count()
-
-    messages = db.query(ChatSession).filter(
-        ChatSession.dataset_id == dataset_id
-    ).order_by(
-        ChatSession.created_at.desc()
-    ).offset(offset).limit(limit).all()
+    # 使用窗口函数在同一查询中返回总数,避免额外的 COUNT 查询
+    result = await db.execute(
+        select(ChatSession, func.count().over().label("total")).where(
+            ChatSession.dataset_id == dataset_id
+        ).order_by(
+            ChatSession.created_at.desc()
+        ).offset(offset).limit(limit)
+    )
+    rows = result.all()
+    messages = [row[0] for row in rows]
+
+    if rows:
+        total_count = rows[0].total
+    elif offset:
+        # 偏移超出范围时窗口查询无返回行,回退到单独计数
+        total_count = await db.scalar(
+            select(func.count()).select_from(ChatSession).where(
+                ChatSession.dataset_id == dataset_id
+            )
+        )
+    else:
+        total_count = 0
 
     return ChatHistoryResponse(
         dataset_id=dataset_id,
@@ -272,7 +609,7 @@ async def get_chat_history(
 @router.delete("/history/{session_id}", summary="Delete chat message")
 async def delete_chat_message(
     session_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     删除单条聊天记录
@@ -287,13 +624,13 @@ async def delete_chat_message(
     Raises:
         HTTPException: 消息不存在
     """
-    chat_session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    chat_session = await db.get(ChatSession, session_id)
 
     if not chat_session:
         raise HTTPException(status_code=404, detail="Chat message not found")
 
-    db.delete(chat_session)
-    db.commit()
+    await db.delete(chat_session)
+    await db.commit()
 
     return {"message": "Chat message deleted successfully", "id": session_id}
 
@@ -301,7 +638,7 @@ async def delete_chat_message(
 @router.delete("/history/dataset/{dataset_id}", summary="Clear dataset chat history")
 async def clear_dataset_history(
     dataset_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     清空数据集的所有聊天记录
@@ -316,16 +653,17 @@ async def clear_dataset_history(
     Raises:
         HTTPException: 数据集不存在
     """
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
     # 删除所有聊天记录
-    deleted_count = db.query(ChatSession).filter(
-        ChatSession.dataset_id == dataset_id
-    ).delete()
+    result = await db.execute(
+        delete(ChatSession).where(ChatSession.dataset_id == dataset_id)
+    )
+    deleted_count = result.rowcount
 
-    db.commit()
+    await db.commit()
 
     return {
         "message": f"Cleared chat history for dataset {dataset_id}",
@@ -336,7 +674,7 @@ async def clear_dataset_history(
 @router.get("/schema/{dataset_id}", response_model=DatasetSchemaResponse, summary="Get dataset schema")
 async def get_dataset_schema(
     dataset_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     获取数据集Schema信息
@@ -353,13 +691,14 @@ async def get_dataset_schema(
     Raises:
         HTTPException: 数据集不存在
     """
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
+    if dataset.status != "active":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
 
     # 提取schema信息
-    numeric_cols = SchemaRetriever.get_numeric_columns(dataset.schema_json)
-    all_cols = SchemaRetriever.get_column_names(dataset.schema_json)
+    numeric_cols, all_cols = _get_schema_columns(dataset)
 
     return DatasetSchemaResponse(
         dataset_id=dataset.id,
@@ -1,48 +1,112 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import os
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Response, BackgroundTasks
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
 import shutil
 from datetime import datetime
 import duckdb
 from pathlib import Path
 
-from backend.database import get_db
+from backend.database import get_db, SessionLocal
 from backend.models.models import Dataset
 from backend.schemas.dataset import DatasetResponse
 from backend.config import get_settings
+from backend.utils import file_cache
+from backend.utils.excel_reader import read_excel_table
 
 settings = get_settings()
 router = APIRouter(prefix="/upload", tags=["upload"])
+logger = logging.getLogger(__name__)
 
 
 # 支持的文件类型
-ALLOWED_EXTENSIONS = {
+ALLOWED_EXTENSIONS = frozenset({
     '.csv', '.xlsx', '.xls', '.json', '.parquet'
-}
+})
+
+# DuckDB 数值类型
+NUMERIC_TYPES = ['BIGINT', 'INTEGER', 'SMALLINT', 'TINYINT',
+                 'DOUBLE', 'FLOAT', 'DECIMAL', 'NUMERIC', 'HUGEINT']
+
+# 行数不超过该值时精确计算唯一值数量，超过时使用 HyperLogLog 近似
+EXACT_DISTINCT_MAX_ROWS = 100_000
+
+# 上传文件复制缓冲区大小
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
 
 # 文件类型对应的 MIME types
-ALLOWED_CONTENT_TYPES = {
+ALLOWED_CONTENT_TYPES = frozenset({
     'text/csv',
     'application/vnd.ms-excel',
     'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
     'application/json',
     'application/octet-stream'  # parquet 文件
+})
+
+# 文件头魔数 -> 实际格式
+FILE_SIGNATURES = {
+    b'PK\x03\x04': 'xlsx',                          # ZIP 容器 (OOXML)
+    b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1': 'xls',   # OLE2 复合文档
+    b'PAR1': 'parquet',
 }
 
+# 扩展名允许的实际格式（CSV 第一格可能以 [ 或 { 开头，因此也接受 json）
+EXTENSION_KINDS = {
+    '.csv': frozenset({'csv', 'json'}),
+    '.xlsx': frozenset({'xlsx'}),
+    '.xls': frozenset({'xls'}),
+    '.json': frozenset({'json'}),
+    '.parquet': frozenset({'parquet'}),
+}
+
+# 格式检测读取的文件头字节数
+SNIFF_BYTES = 512
+
+
+def sniff_file_type(head: bytes) -> Optional[str]:
+    """
+    根据文件头字节判断实际格式
+
+    二进制格式按魔数识别；文本中首个非空白字符为 { 或 [ 视为 JSON，
+    其余不含 NUL 字节的文本视为 CSV
+
+    Args:
+        head: 文件开头的若干字节
+
+    Returns:
+        Optional[str]: xlsx / xls / parquet / json / csv，无法识别时返回 None
+    """
+    for signature, kind in FILE_SIGNATURES.items():
+        if head.startswith(signature):
+            return kind
+
+    if not head or b'\x00' in head:
+        return None
+
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if text[:1] in (b'{', b'['):
+        return 'json'
+    return 'csv'
 
-def validate_file(file: UploadFile) -> None:
+
+async def validate_file(file: UploadFile) -> str:
     """
     验证上传的文件
 
     检查项：
     1. 文件扩展名是否支持
     2. 文件 MIME 类型是否允许
-    3. 文件大小是否超过限制
+    3. 文件头魔数与扩展名是否一致（客户端上报的 MIME 类型不可信）
 
     Args:
         file: 上传的文件对象
 
+    Returns:
+        str: 小写的文件扩展名，供后续步骤复用
+
     Raises:
         HTTPException: 如果验证失败
     """
@@ -51,7 +115,7 @@ def validate_file(file: UploadFile) -> None:
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"不支持的文件类型。支持的类型: {', '.join(ALLOWED_EXTENSIONS)}"
+            detail=f"不支持的文件类型。支持的类型: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
         )
 
     # 检查 MIME 类型
@@ -61,48 +125,258 @@ def validate_file(file: UploadFile) -> None:
             detail="不支持的文件格式"
         )
 
+    # 只读取文件头判断实际格式
+    head = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    if sniff_file_type(head) not in EXTENSION_KINDS[file_ext]:
+        raise HTTPException(
+            status_code=400,
+            detail="文件内容与扩展名不符"
+        )
+
+    return file_ext
 
-def save_upload_file(file: UploadFile) -> tuple[str, int]:
+
+def ensure_upload_dir() -> None:
+    """
+    创建上传目录
+
+    在应用启动时调用一次，save_upload_file 不再在每个请求中执行 mkdir
+    """
+    Path(settings.upload_dir).mkdir(parents=True, exist_ok=True)
+
+
+class _UploadTooLarge(Exception):
+    """上传文件超过大小限制"""
+
+
+def _copy_upload(src, dst, limit: int, digest) -> int:
+    """
+    将上传的临时文件内容复制到目标文件，超过 limit 字节时中止，同时计算内容哈希
+
+    按大块逐块读取，每块先 update 进哈希再写入目标文件，文件内容只读一遍；
+    累计字节数一旦超限立即中止
+
+    Args:
+        src: 上传文件的底层文件对象
+        dst: 以二进制写模式打开的目标文件
+        limit: 允许的最大字节数
+        digest: hashlib 哈希对象，复制的内容会依次 update 进去
+
+    Returns:
+        int: 写入的字节数
+
+    Raises:
+        _UploadTooLarge: 文件超过大小限制
+    """
+    src.seek(0)
+    written = 0
+    while chunk := src.read(COPY_BUFFER_SIZE):
+        written += len(chunk)
+        if written > limit:
+            raise _UploadTooLarge()
+        digest.update(chunk)
+        dst.write(chunk)
+    return written
+
+
+def _file_too_large() -> HTTPException:
+    """构造文件超限的 413 错误"""
+    return HTTPException(
+        status_code=413,
+        detail=f"文件大小超过限制 ({settings.max_file_size / 1024 / 1024}MB)"
+    )
+
+
+def save_upload_file(file: UploadFile) -> tuple[str, int, str]:
     """
     保存上传的文件到服务器
 
     文件命名规则: timestamp_originalfilename
     例如: 20231106_123456_data.csv
 
+    大小检查在写入之前或写入过程中完成，超限时不会写满整个文件再删除；
+    写入时同时计算内容的 SHA-256，用于识别重复上传
+
     Args:
         file: 上传的文件对象
 
     Returns:
-        tuple: (保存的文件路径, 文件大小)
+        tuple: (保存的文件路径, 文件大小, 内容 SHA-256 十六进制摘要)
+
+    Raises:
+        HTTPException: 文件超过大小限制 (413)
     """
-    # 确保上传目录存在
+    # 已知大小时先检查，超限文件不写入磁盘
+    if file.size is not None and file.size > settings.max_file_size:
+        raise _file_too_large()
+
+    # 上传目录在应用启动时创建 (ensure_upload_dir)
     upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(parents=True, exist_ok=True)
 
     # 生成唯一文件名（加时间戳避免重名）
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     safe_filename = f"{timestamp}_{file.filename}"
     file_path = upload_dir / safe_filename
 
-    # 保存文件
-    file_size = 0
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        file_size = file_path.stat().st_size
+    # 保存文件，超限时中止并删除已写入的部分
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "wb") as buffer:
+            file_size = _copy_upload(file.file, buffer, settings.max_file_size, digest)
+    except _UploadTooLarge:
+        file_path.unlink(missing_ok=True)
+        raise _file_too_large()
+
+    return str(file_path), file_size, digest.hexdigest()
+
+
+# Polars 类型名到 DuckDB 类型名的映射，保证两种分析后端输出的 dtype 一致
+POLARS_TO_DUCKDB_TYPES = {
+    'Int8': 'TINYINT', 'Int16': 'SMALLINT', 'Int32': 'INTEGER', 'Int64': 'BIGINT',
+    'UInt8': 'UTINYINT', 'UInt16': 'USMALLINT', 'UInt32': 'UINTEGER', 'UInt64': 'UBIGINT',
+    'Float32': 'FLOAT', 'Float64': 'DOUBLE', 'Decimal': 'DECIMAL',
+    'Utf8': 'VARCHAR', 'Boolean': 'BOOLEAN', 'Date': 'DATE', 'Datetime': 'TIMESTAMP',
+    'Time': 'TIME', 'Duration': 'INTERVAL',
+}
+
+
+def analyze_dataset_polars(file_path: str, file_ext: str) -> dict:
+    """
+    使用 Polars 惰性扫描分析 CSV / Parquet 数据集
+
+    所有列的统计表达式在一次 select 中计算，以流式模式多线程执行，
+    内存占用不随文件大小增长。输出格式与 analyze_dataset 相同
+
+    Args:
+        file_path: 文件路径 (.csv / .parquet)
+        file_ext: 小写的文件扩展名
+
+    Returns:
+        dict: 包含 schema 和 row_count 的字典
+    """
+    import polars as pl
+
+    if file_ext == '.parquet':
+        lf = pl.scan_parquet(file_path)
+    else:
+        lf = pl.scan_csv(file_path, try_parse_dates=True)
+
+    columns = list(lf.schema.items())
+
+    # 行数不多时精确计算唯一值数量，大表使用近似值（与 DuckDB 后端一致）
+    approx_unique = lf.select(pl.count()).collect().item() > EXACT_DISTINCT_MAX_ROWS
+
+    # 用位置作为别名，避免与原列名冲突
+    exprs = [pl.count().alias("n")]
+    for i, (col_name, dtype) in enumerate(columns):
+        col = pl.col(col_name)
+        exprs.append(col.null_count().alias(f"{i}_null"))
+        unique = col.drop_nulls().approx_n_unique() if approx_unique else col.drop_nulls().n_unique()
+        exprs.append(unique.alias(f"{i}_unique"))
+        if dtype.is_numeric():
+            exprs.append(col.min().alias(f"{i}_min"))
+            exprs.append(col.max().alias(f"{i}_max"))
+            exprs.append(col.mean().alias(f"{i}_mean"))
+
+    stats = lf.select(exprs).collect(streaming=True).row(0, named=True)
+    row_count = stats["n"]
+
+    schema = []
+    for i, (col_name, dtype) in enumerate(columns):
+        type_name = getattr(dtype, "base_type", lambda: dtype)().__name__
+        null_count = stats[f"{i}_null"]
+        col_info = {
+            "name": col_name,
+            "dtype": POLARS_TO_DUCKDB_TYPES.get(type_name, type_name.upper()),
+            "non_null_count": row_count - null_count,
+            "null_count": null_count,
+            "unique_count": stats[f"{i}_unique"]
+        }
+
+        if dtype.is_numeric():
+            col_info.update({
+                "min": float(stats[f"{i}_min"]) if stats[f"{i}_min"] is not None else None,
+                "max": float(stats[f"{i}_max"]) if stats[f"{i}_max"] is not None else None,
+                "mean": float(stats[f"{i}_mean"]) if stats[f"{i}_mean"] is not None else None,
+            })
+
+        schema.append(col_info)
+
+    return {
+        "schema_json": schema,
+        "row_count": row_count
+    }
+
+
+def _duckdb_source(conn, file_path: str, file_ext: str) -> tuple[str, list]:
+    """
+    根据文件类型确定 DuckDB 查询的数据源
+
+    DuckDB 能直接读取的格式不先物化为表，Parquet 还可以利用文件自带的元数据和列裁剪；
+    Excel 通过 calamine（未安装时退回 openpyxl）读取第一个 sheet，
+    构建 Arrow 表后直接注册到游标上，无需临时文件
+
+    Args:
+        conn: DuckDB 游标
+        file_path: 文件路径
+        file_ext: 小写的文件扩展名
+
+    Returns:
+        tuple: (FROM 子句中的数据源表达式, 查询参数)
+    """
+    if file_ext == '.csv':
+        return "read_csv_auto(?)", [file_path]
+    if file_ext in ['.xlsx', '.xls']:
+        conn.register("data", read_excel_table(file_path))
+        return "data", []
+    if file_ext == '.json':
+        return "read_json_auto(?)", [file_path]
+    if file_ext == '.parquet':
+        return "read_parquet(?)", [file_path]
+    raise ValueError(f"不支持的文件类型: {file_ext}")
+
+
+def convert_to_parquet(file_path: str, file_ext: str) -> Optional[str]:
+    """
+    将上传的文件转换为 Parquet（zstd 压缩）保存在原文件旁
+
+    CSV / Excel / JSON 每次查询都要重新解析，解析耗时远大于扫描；
+    转换后分析、图表和问答都读取 Parquet，可以利用列裁剪和元数据
+
+    Args:
+        file_path: 原始文件路径
+        file_ext: 小写的文件扩展名
+
+    Returns:
+        Optional[str]: Parquet 文件路径；原文件已是 Parquet 时返回 None
+    """
+    if file_ext == '.parquet':
+        return None
 
-    # 检查文件大小
-    if file_size > settings.max_file_size:
-        # 删除超大文件
-        file_path.unlink()
+    parquet_path = f"{file_path}.parquet"
+    conn = duckdb.connect(':memory:')
+    try:
+        source, params = _duckdb_source(conn, file_path, file_ext)
+        # COPY 的目标路径不支持参数绑定，按 SQL 字符串字面量转义
+        target = parquet_path.replace("'", "''")
+        conn.execute(
+            f"COPY (SELECT * FROM {source}) TO '{target}' (FORMAT PARQUET, CODEC 'zstd')",
+            params
+        )
+    except Exception as e:
+        Path(parquet_path).unlink(missing_ok=True)
         raise HTTPException(
-            status_code=400,
-            detail=f"文件大小超过限制 ({settings.max_file_size / 1024 / 1024}MB)"
+            status_code=500,
+            detail=f"转换 Parquet 失败: {str(e)}"
         )
+    finally:
+        conn.close()
 
-    return str(file_path), file_size
+    return parquet_path
 
 
-def analyze_dataset(file_path: str) -> dict:
+def analyze_dataset(file_path: str, file_ext: Optional[str] = None) -> dict:
     """
     使用 DuckDB 分析数据集，提取元数据
 
@@ -112,117 +386,91 @@ def analyze_dataset(file_path: str) -> dict:
     - 原生 SQL 支持
     - 直接读取多种格式
 
-    提取信息：
+    提取信息（通过一条融合的聚合查询一次扫描完成）：
     1. 行数
-    2. 列信息（列名、数据类型、非空数量等）
-    3. 基本统计信息
+    2. 列信息（列名、数据类型、非空数量、唯一值数量）
+       超过 EXACT_DISTINCT_MAX_ROWS 行时唯一值数量为 HyperLogLog 近似值
+    3. 数值列的基本统计信息
 
     Args:
         file_path: 文件路径
+        file_ext: 小写的文件扩展名（省略时从 file_path 获取）
 
     Returns:
         dict: 包含 schema 和 row_count 的字典
     """
-    file_ext = Path(file_path).suffix.lower()
+    if file_ext is None:
+        file_ext = Path(file_path).suffix.lower()
+
+    # 配置为 Polars 后端时，CSV / Parquet 交给 Polars 分析
+    if settings.analyzer_backend == "polars" and file_ext in ('.csv', '.parquet'):
+        try:
+            return analyze_dataset_polars(file_path, file_ext)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"解析文件失败: {str(e)}"
+            )
+
+    # 每次分析使用独立的内存连接，关闭后随之释放；
+    # 共享连接上创建的游标会被连接一直保留，每次上传都会占用内存
+    conn = duckdb.connect(':memory:')
 
     try:
-        # 创建 DuckDB 连接（内存模式）
-        conn = duckdb.connect(':memory:')
-
-        # 根据文件类型读取数据到 DuckDB
-        if file_ext == '.csv':
-            # DuckDB 可以直接读取 CSV
-            conn.execute(f"CREATE TABLE data AS SELECT * FROM read_csv_auto('{file_path}')")
-        elif file_ext in ['.xlsx', '.xls']:
-            # Excel 需要先用 openpyxl 读取，但 DuckDB 0.9+ 支持直接读取
-            # 这里使用临时方案：先转 CSV 再读取
-            import openpyxl
-            import csv
-            import tempfile
-
-            # 读取 Excel 第一个 sheet
-            wb = openpyxl.load_workbook(file_path, read_only=True)
-            ws = wb.active
-
-            # 写入临时 CSV
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp:
-                csv_writer = csv.writer(tmp)
-                for row in ws.iter_rows(values_only=True):
-                    csv_writer.writerow(row)
-                tmp_path = tmp.name
-
-            # 用 DuckDB 读取临时 CSV
-            conn.execute(f"CREATE TABLE data AS SELECT * FROM read_csv_auto('{tmp_path}')")
-            os.remove(tmp_path)
-            wb.close()
-
-        elif file_ext == '.json':
-            # DuckDB 可以直接读取 JSON
-            conn.execute(f"CREATE TABLE data AS SELECT * FROM read_json_auto('{file_path}')")
-        elif file_ext == '.parquet':
-            # DuckDB 原生支持 Parquet
-            conn.execute(f"CREATE TABLE data AS SELECT * FROM read_parquet('{file_path}')")
-        else:
-            raise ValueError(f"不支持的文件类型: {file_ext}")
+        source, params = _duckdb_source(conn, file_path, file_ext)
 
-        # 获取行数
-        row_count = conn.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+        # 列名和类型只读取元数据，不扫描数据
+        columns = conn.execute(f"DESCRIBE SELECT * FROM {source}", params).fetchall()
 
-        # 获取列信息
-        columns_info = conn.execute("DESCRIBE data").fetchall()
+        # 行数不多时精确计算唯一值数量；大表改用 HyperLogLog 近似，内存占用恒定
+        # Parquet 的行数直接从文件元数据读取，不扫描数据
+        total_rows = conn.execute(f"SELECT COUNT(*) FROM {source}", params).fetchone()[0]
+        if total_rows > EXACT_DISTINCT_MAX_ROWS:
+            distinct_template = "APPROX_COUNT_DISTINCT({})"
+        else:
+            distinct_template = "COUNT(DISTINCT {})"
+
+        # 所有列的统计信息融合到一条聚合查询中，一次扫描完成
+        # SUMMARIZE 会额外计算标准差和分位数，这里只计算需要的指标
+        select_exprs = ["COUNT(*)"]
+        for col_name, col_type, *_ in columns:
+            quoted = '"' + col_name.replace('"', '""') + '"'
+            select_exprs.append(f"COUNT({quoted})")
+            select_exprs.append(distinct_template.format(quoted))
+            if any(num_type in col_type.upper() for num_type in NUMERIC_TYPES):
+                select_exprs.append(f"MIN({quoted})")
+                select_exprs.append(f"MAX({quoted})")
+                select_exprs.append(f"AVG({quoted})")
+
+        stats = conn.execute(f"SELECT {', '.join(select_exprs)} FROM {source}", params).fetchone()
+        row_count = stats[0]
 
         schema = []
-        for col_name, col_type, null_info, *_ in columns_info:
-            # 获取该列的统计信息
-            # 使用双引号包裹列名以支持包含空格的列名
-            stats_query = f"""
-                SELECT
-                    COUNT("{col_name}") as non_null_count,
-                    COUNT(*) - COUNT("{col_name}") as null_count,
-                    COUNT(DISTINCT "{col_name}") as unique_count
-                FROM data
-            """
-            non_null_count, null_count, unique_count = conn.execute(stats_query).fetchone()
+        pos = 1
+        for col_name, col_type, *_ in columns:
+            non_null_count, unique_count = stats[pos], stats[pos + 1]
+            pos += 2
 
             col_info = {
                 "name": col_name,
                 "dtype": col_type,
-                "non_null_count": int(non_null_count),
-                "null_count": int(null_count),
-                "unique_count": int(unique_count)
+                "non_null_count": non_null_count,
+                "null_count": row_count - non_null_count,
+                "unique_count": unique_count
             }
 
             # 如果是数值类型，添加统计信息
-            numeric_types = ['BIGINT', 'INTEGER', 'SMALLINT', 'TINYINT',
-                           'DOUBLE', 'FLOAT', 'DECIMAL', 'NUMERIC', 'HUGEINT']
-
-            if any(num_type in col_type.upper() for num_type in numeric_types):
-                try:
-                    # 使用双引号包裹列名以支持包含空格的列名
-                    stats_query = f"""
-                        SELECT
-                            MIN("{col_name}") as min_val,
-                            MAX("{col_name}") as max_val,
-                            AVG("{col_name}") as mean_val
-                        FROM data
-                        WHERE "{col_name}" IS NOT NULL
-                    """
-                    min_val, max_val, mean_val = conn.execute(stats_query).fetchone()
-
-                    col_info.update({
-                        "min": float(min_val) if min_val is not None else None,
-                        "max": float(max_val) if max_val is not None else None,
-                        "mean": float(mean_val) if mean_val is not None else None,
-                    })
-                except Exception as e:
-                    # 如果统计失败，跳过
-                    pass
+            if any(num_type in col_type.upper() for num_type in NUMERIC_TYPES):
+                min_val, max_val, avg_val = stats[pos:pos + 3]
+                pos += 3
+                col_info.update({
+                    "min": float(min_val) if min_val is not None else None,
+                    "max": float(max_val) if max_val is not None else None,
+                    "mean": float(avg_val) if avg_val is not None else None,
+                })
 
             schema.append(col_info)
 
-        # 关闭连接
-        conn.close()
-
         return {
             "schema_json": schema,
             "row_count": row_count
@@ -233,14 +481,131 @@ def analyze_dataset(file_path: str) -> dict:
             status_code=500,
             detail=f"解析文件失败: {str(e)}"
         )
+    finally:
+        # 关闭游标，同时释放其注册的表
+        conn.close()
+
+
+def _remove_files(*paths: Optional[str]) -> None:
+    """
+    删除文件，忽略空路径和不存在的文件
+
+    直接 unlink(missing_ok=True)，避免先 exists 再 remove 的两次系统调用和竞态
+
+    Args:
+        paths: 文件路径
+    """
+    for path in paths:
+        if path:
+            Path(path).unlink(missing_ok=True)
+
+
+def reuse_dataset(
+    source_parquet: Optional[str],
+    analysis_result: dict,
+    file_path: str,
+    file_ext: str
+) -> Tuple[Optional[str], dict]:
+    """
+    复用内容相同的已有数据集的分析结果（同步执行，在线程池中调用）
+
+    已有数据集的 Parquet 文件直接复制一份，不再解析和分析原文件；
+    复制失败（例如文件已被清理）时退回完整处理
+
+    Args:
+        source_parquet: 已有数据集的 Parquet 文件路径（原文件即 Parquet 时为 None）
+        analysis_result: 已有数据集的 schema_json 和 row_count
+        file_path: 新上传的文件路径
+        file_ext: 小写的文件扩展名
+
+    Returns:
+        tuple: (Parquet 文件路径或 None, 分析结果)
+    """
+    if source_parquet is None:
+        return None, analysis_result
+
+    parquet_path = f"{file_path}.parquet"
+    try:
+        shutil.copyfile(source_parquet, parquet_path)
+    except OSError:
+        _remove_files(parquet_path)
+        return process_dataset(file_path, file_ext)
+    return parquet_path, analysis_result
+
+
+def process_dataset(file_path: str, file_ext: str) -> Tuple[Optional[str], dict]:
+    """
+    转换 Parquet 并分析数据集（同步执行，在线程池中调用）
+
+    分析失败时删除已生成的 Parquet 文件
+
+    Args:
+        file_path: 原始文件路径
+        file_ext: 小写的文件扩展名
+
+    Returns:
+        tuple: (Parquet 文件路径或 None, analyze_dataset 的结果)
+    """
+    parquet_path = convert_to_parquet(file_path, file_ext)
+    try:
+        if parquet_path:
+            analysis_result = analyze_dataset(parquet_path, '.parquet')
+        else:
+            analysis_result = analyze_dataset(file_path, file_ext)
+    except Exception:
+        _remove_files(parquet_path)
+        raise
+    return parquet_path, analysis_result
+
+
+async def _run_analysis(dataset_id: int, file_path: str, file_ext: str) -> None:
+    """
+    后台分析任务：分析完成后更新数据集记录
+
+    使用独立的数据库会话（请求的会话在响应返回后已关闭）。
+    只更新仍处于 analyzing 状态的记录，分析期间被删除的数据集不会被恢复，
+    此时删除本次生成的 Parquet 文件
+
+    Args:
+        dataset_id: 数据集ID
+        file_path: 原始文件路径
+        file_ext: 小写的文件扩展名
+    """
+    try:
+        parquet_path, analysis_result = await asyncio.to_thread(process_dataset, file_path, file_ext)
+    except Exception:
+        logger.exception("Dataset analysis failed")
+        await asyncio.to_thread(_remove_files, file_path)
+        values = {"status": "failed"}
+    else:
+        values = {
+            "parquet_path": parquet_path,
+            "schema_json": analysis_result["schema_json"],
+            "row_count": analysis_result["row_count"],
+            "status": "active",
+        }
+
+    async with SessionLocal() as db:
+        result = await db.execute(
+            update(Dataset)
+            .where(Dataset.id == dataset_id, Dataset.status == "analyzing")
+            .values(**values)
+        )
+        await db.commit()
+
+    # 记录已在分析期间被删除，删除接口看不到刚生成的 Parquet 文件，在这里清理
+    if result.rowcount == 0 and values.get("parquet_path"):
+        await asyncio.to_thread(_remove_files, values["parquet_path"])
 
 
 @router.post("/", response_model=DatasetResponse)
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    background: bool = Form(False),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     上传数据文件
@@ -254,93 +619,189 @@ async def upload_file(
     工作流程：
     1. 验证文件类型和大小
     2. 保存文件到服务器
-    3. 解析文件，提取 schema 信息
-    4. 将元数据保存到数据库
-    5. 返回数据集信息
+    3. 转换为 Parquet（原文件不是 Parquet 时）
+    4. 解析文件，提取 schema 信息
+    5. 将元数据保存到数据库
+    6. 返回数据集信息
+
+    已有内容相同（SHA-256 一致）且格式相同的数据集时，复用其 Parquet 文件和分析结果，跳过第 3、4 步
+
+    background 为 True 时，保存文件后立即创建 status 为 analyzing 的记录并返回，
+    第 3、4 步在后台执行；完成后 status 变为 active（失败为 failed），
+    客户端可轮询 GET /upload/datasets/{id} 获取结果；分析完成前问答和图表接口返回 409
 
     Args:
+        background_tasks: 后台任务
         file: 上传的文件
         name: 数据集名称（可选，默认使用文件名）
         description: 数据集描述（可选）
+        background: 是否在后台分析（可选，默认 False）
         db: 数据库会话
 
     Returns:
         DatasetResponse: 创建的数据集信息
     """
     # 1. 验证文件
-    validate_file(file)
+    file_ext = await validate_file(file)
 
-    # 2. 保存文件
-    file_path, file_size = save_upload_file(file)
+    # 2. 保存文件（磁盘 I/O 放到线程池，不阻塞事件循环）
+    file_path, file_size, content_hash = await asyncio.to_thread(save_upload_file, file)
 
+    parquet_path = None
+    analyze_later = False
     try:
-        # 3. 分析数据集
-        analysis_result = analyze_dataset(file_path)
+        # 3-4. 转换为 Parquet 并分析，后续分析和查询都读取转换后的文件
+        # 内容相同的数据集已分析过时，直接复用其 Parquet 文件和分析结果
+        result = await db.execute(
+            select(Dataset.parquet_path, Dataset.schema_json, Dataset.row_count)
+            .where(
+                Dataset.content_hash == content_hash,
+                Dataset.file_type == file_ext,
+                Dataset.status == "active"
+            )
+            .limit(1)
+        )
+        duplicate = result.first()
+
+        if duplicate is not None:
+            parquet_path, analysis_result = await asyncio.to_thread(
+                reuse_dataset,
+                duplicate.parquet_path,
+                {"schema_json": duplicate.schema_json, "row_count": duplicate.row_count},
+                file_path,
+                file_ext
+            )
+        elif background:
+            parquet_path, analysis_result = None, {"schema_json": None, "row_count": 0}
+            analyze_later = True
+        else:
+            parquet_path, analysis_result = await asyncio.to_thread(process_dataset, file_path, file_ext)
 
-        # 4. 创建数据库记录
+        # 5. 创建数据库记录
         dataset = Dataset(
             name=name or file.filename,
             description=description,
             file_path=file_path,
+            parquet_path=parquet_path,
             original_filename=file.filename,
             file_size=file_size,
-            file_type=Path(file.filename).suffix.lower(),
+            file_type=file_ext,
+            content_hash=content_hash,
             schema_json=analysis_result["schema_json"],
             row_count=analysis_result["row_count"],
-            status="active"
+            status="analyzing" if analyze_later else "active"
         )
 
         db.add(dataset)
-        db.commit()
-        db.refresh(dataset)
-
-        return dataset
+        await db.commit()
+        await db.refresh(dataset)
 
     except Exception as e:
-        # 如果出错，删除已上传的文件
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        # 打印详细错误信息用于调试
-        import traceback
-        print(f"上传文件时出错: {type(e).__name__}: {str(e)}")
-        print(traceback.format_exc())
+        # 如果出错，删除已上传和转换的文件
+        await asyncio.to_thread(_remove_files, file_path, parquet_path)
+        logger.exception("上传文件时出错")
         raise HTTPException(
             status_code=500,
             detail=f"处理文件时出错: {type(e).__name__}: {str(e) or repr(e)}"
         )
 
+    if analyze_later:
+        background_tasks.add_task(_run_analysis, dataset.id, file_path, file_ext)
+
+    return dataset
+
+
+def _parse_dataset_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    解析 list_datasets 的分页游标
+
+    Args:
+        cursor: X-Next-Cursor 给出的 "创建时间,ID"
+
+    Returns:
+        tuple: (创建时间, 数据集ID)
+
+    Raises:
+        HTTPException: 游标格式错误 (400)
+    """
+    created_at, _, dataset_id = cursor.rpartition(",")
+    try:
+        return datetime.fromisoformat(created_at), int(dataset_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor 格式错误，应为 X-Next-Cursor 返回的值")
+
 
 @router.get("/datasets", response_model=List[DatasetResponse])
 async def list_datasets(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    ids: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     获取所有数据集列表
 
-    支持分页查询
+    支持两种分页方式：
+    - skip/limit: 偏移分页，深度翻页时数据库需要排序并跳过 skip 行
+    - cursor/limit: 游标分页，按 (created_at, id) 倒序只返回排在 cursor 之后的记录，
+      借助 (status, created_at, id) 索引直接定位，耗时与页码无关；
+      id 作为同一创建时间内的次序，翻页边界上创建时间相同的记录不会被跳过
+
+    返回满一页时，响应头 X-Next-Cursor 给出下一页的 cursor
+
+    提供 ids 时按 ID 批量获取（如 ids=1,2,3），一次请求代替逐个获取详情，
+    此时忽略分页参数，不存在的 ID 直接跳过
 
     Args:
-        skip: 跳过的记录数（用于分页）
+        response: 响应对象（用于设置分页响应头）
+        skip: 跳过的记录数（用于分页，提供 cursor 时忽略）
         limit: 返回的最大记录数
+        cursor: 上一页最后一条记录的 "创建时间,ID"（取自 X-Next-Cursor）
+        ids: 逗号分隔的数据集ID列表
         db: 数据库会话
 
     Returns:
         List[DatasetResponse]: 数据集列表
     """
-    datasets = db.query(Dataset)\
-        .filter(Dataset.status == "active")\
-        .order_by(Dataset.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    if ids is not None:
+        try:
+            dataset_ids = {int(i) for i in ids.split(",") if i.strip()}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids 必须是逗号分隔的整数")
+
+        result = await db.execute(
+            select(Dataset)
+            .where(Dataset.id.in_(dataset_ids), Dataset.status == "active")
+            .order_by(Dataset.created_at.desc())
+        )
+        return result.scalars().all()
+
+    stmt = (
+        select(Dataset)
+        .where(Dataset.status == "active")
+        .order_by(Dataset.created_at.desc(), Dataset.id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        cursor_created_at, cursor_id = _parse_dataset_cursor(cursor)
+        stmt = stmt.where(tuple_(Dataset.created_at, Dataset.id) < (cursor_created_at, cursor_id))
+    else:
+        stmt = stmt.offset(skip)
+
+    result = await db.execute(stmt)
+    datasets = result.scalars().all()
+
+    if datasets and len(datasets) == limit:
+        last = datasets[-1]
+        response.headers["X-Next-Cursor"] = f"{last.created_at.isoformat()},{last.id}"
 
     return datasets
 
 
 @router.get("/datasets/{dataset_id}", response_model=DatasetResponse)
-async def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
+async def get_dataset(dataset_id: int, db: AsyncSession = Depends(get_db)):
     """
     获取单个数据集的详细信息
 
@@ -351,7 +812,7 @@ async def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
     Returns:
         DatasetResponse: 数据集信息
     """
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
 
     if not dataset:
         raise HTTPException(status_code=404, detail="数据集不存在")
@@ -360,13 +821,13 @@ async def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
 
 
 @router.delete("/datasets/{dataset_id}")
-async def delete_dataset(dataset_id: int, db: Session = Depends(get_db)):
+async def delete_dataset(dataset_id: int, db: AsyncSession = Depends(get_db)):
     """
     删除数据集
 
     同时删除：
     1. 数据库记录（软删除，设置 status 为 deleted）
-    2. 服务器上的文件
+    2. 服务器上的文件（包括转换后的 Parquet 文件）
 
     Args:
         dataset_id: 数据集ID
@@ -375,7 +836,7 @@ async def delete_dataset(dataset_id: int, db: Session = Depends(get_db)):
     Returns:
         dict: 删除结果
     """
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = await db.get(Dataset, dataset_id)
 
     if not dataset:
         raise HTTPException(status_code=404, detail="数据集不存在")
@@ -384,9 +845,11 @@ async def delete_dataset(dataset_id: int, db: Session = Depends(get_db)):
     dataset.status = "deleted"
 
     # 删除文件
-    if os.path.exists(dataset.file_path):
-        os.remove(dataset.file_path)
+    await asyncio.to_thread(_remove_files, dataset.file_path, dataset.parquet_path)
+    file_cache.invalidate(dataset.file_path)
+    if dataset.parquet_path:
+        file_cache.invalidate(dataset.parquet_path)
 
-    db.commit()
+    await db.commit()
 
     return {"message": f"数据集 {dataset.name} 已删除"}
@@ -15,6 +15,7 @@ class DatasetCreate(DatasetBase):
 class DatasetResponse(DatasetBase):
     id: int
     file_path: str
+    parquet_path: Optional[str] = None
     original_filename: str
     file_size: int
     file_type: str
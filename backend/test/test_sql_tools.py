@@ -4,6 +4,7 @@ SQL查询工具集测试脚本
 """
 
 import asyncio
+import io
 import sys
 from pathlib import Path
 
@@ -13,6 +14,21 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from backend.utils.sql_tools import SQLExecutor, SchemaRetriever
 
 
+# SQL 验证测试用例: (SQL, 是否应通过, 描述)
+SQL_VALIDATION_CASES = (
+    ("SELECT * FROM data", True, "基本SELECT查询"),
+    ("SELECT name, age FROM data WHERE age > 18", True, "带WHERE条件"),
+    ("SELECT COUNT(*) FROM data GROUP BY category", True, "聚合查询"),
+    ("DROP TABLE data", False, "危险的DROP操作"),
+    ("DELETE FROM data WHERE id=1", False, "危险的DELETE操作"),
+    ("SELECT * FROM data; DROP TABLE users", False, "SQL注入尝试"),
+    ("UPDATE data SET name='test'", False, "危险的UPDATE操作"),
+)
+
+# NL2SQL 测试同时进行的最大 LLM 请求数
+NL2SQL_CONCURRENCY = 3
+
+
 def test_sql_validation():
     """测试SQL验证功能"""
     print("\n" + "="*60)
@@ -23,38 +39,31 @@ def test_sql_validation():
     executor = SQLExecutor.__new__(SQLExecutor)
     executor.table_name = "data"
 
-    # 测试用例
-    test_cases = [
-        ("SELECT * FROM data", True, "基本SELECT查询"),
-        ("SELECT name, age FROM data WHERE age > 18", True, "带WHERE条件"),
-        ("SELECT COUNT(*) FROM data GROUP BY category", True, "聚合查询"),
-        ("DROP TABLE data", False, "危险的DROP操作"),
-        ("DELETE FROM data WHERE id=1", False, "危险的DELETE操作"),
-        ("SELECT * FROM data; DROP TABLE users", False, "SQL注入尝试"),
-        ("UPDATE data SET name='test'", False, "危险的UPDATE操作"),
+    # 每个用例只调用一次 validate_sql
+    results = [
+        (sql, should_pass, description, *executor.validate_sql(sql))
+        for sql, should_pass, description in SQL_VALIDATION_CASES
     ]
+    passed = sum(1 for _, should_pass, _, is_valid, _ in results if is_valid == should_pass)
+    failed = len(results) - passed
 
-    passed = 0
-    failed = 0
-
-    for sql, should_pass, description in test_cases:
-        is_valid, error = executor.validate_sql(sql)
+    # 逐用例输出先写入缓冲区,最后一次性写到stdout,避免每行一次write调用
+    buf = io.StringIO()
+    for sql, should_pass, description, is_valid, error in results:
         status = "✅ PASS" if is_valid == should_pass else "❌ FAIL"
 
-        if is_valid == should_pass:
-            passed += 1
-        else:
-            failed += 1
-
-        print(f"\n{status} - {description}")
-        print(f"SQL: {sql}")
-        print(f"Expected: {'Valid' if should_pass else 'Invalid'}, Got: {'Valid' if is_valid else 'Invalid'}")
+        print(f"\n{status} - {description}", file=buf)
+        print(f"SQL: {sql}", file=buf)
+        print(f"Expected: {'Valid' if should_pass else 'Invalid'}, Got: {'Valid' if is_valid else 'Invalid'}", file=buf)
         if error:
-            print(f"Error: {error}")
+            print(f"Error: {error}", file=buf)
 
-    print(f"\n{'='*60}")
-    print(f"测试结果: {passed} passed, {failed} failed")
-    print(f"{'='*60}")
+    print(f"\n{'='*60}", file=buf)
+    print(f"测试结果: {passed} passed, {failed} failed", file=buf)
+    print(f"{'='*60}", file=buf)
+
+    sys.stdout.write(buf.getvalue())
+    sys.stdout.flush()
 
     return failed == 0
 
@@ -110,6 +119,14 @@ def test_schema_retriever():
     assert "quantity" in numeric_cols
     assert "product" not in numeric_cols
 
+    # 只有整个类型名是数值类型才算数值列,列表等复合类型不算
+    typed_cols = SchemaRetriever.get_numeric_columns([
+        {"name": "ids", "dtype": "BIGINT[]"},
+        {"name": "price", "dtype": "DECIMAL(10,2)"},
+        {"name": "total", "dtype": "UBIGINT"},
+    ])
+    assert typed_cols == ["price", "total"]
+
     # 测试LLM格式化
     llm_format = SchemaRetriever.format_schema_for_llm(mock_schema)
     print(f"\n✅ LLM格式化Schema:\n{llm_format}")
@@ -209,13 +226,24 @@ async def test_nl2sql():
             "每个类别的总销售额?"
         ]
 
-        for question in test_questions:
+        # 并发发送所有问题,限制同时进行的请求数以适应服务商的并发限制
+        semaphore = asyncio.Semaphore(NL2SQL_CONCURRENCY)
+
+        async def convert(question):
+            async with semaphore:
+                return await converter.convert(question, mock_schema)
+
+        results = await asyncio.gather(
+            *(convert(question) for question in test_questions),
+            return_exceptions=True
+        )
+
+        for question, result in zip(test_questions, results):
             print(f"\n🔄 问题: {question}")
-            try:
-                sql = await converter.convert(question, mock_schema)
-                print(f"✅ 生成的SQL: {sql}")
-            except Exception as e:
-                print(f"❌ 转换失败: {str(e)}")
+            if isinstance(result, Exception):
+                print(f"❌ 转换失败: {str(result)}")
+            else:
+                print(f"✅ 生成的SQL: {result}")
 
         print(f"\n{'='*60}")
         print("NL2SQL测试完成!")
@@ -229,8 +257,8 @@ async def test_nl2sql():
         return False
 
 
-def main():
-    """运行所有测试"""
+async def main():
+    """运行所有测试 (整个测试套件共用一个事件循环)"""
     print("\n" + "🧪 SQL查询工具集测试套件" + "\n")
 
     results = []
@@ -242,12 +270,8 @@ def main():
     results.append(("Schema检索", test_schema_retriever()))
 
     # 测试3 & 4: 异步测试
-    async def run_async_tests():
-        llm_result = await test_llm_client()
-        nl2sql_result = await test_nl2sql()
-        return llm_result, nl2sql_result
-
-    llm_result, nl2sql_result = asyncio.run(run_async_tests())
+    # 两个测试相互独立,并发执行以缩短等待 LLM 响应的总时间
+    llm_result, nl2sql_result = await asyncio.gather(test_llm_client(), test_nl2sql())
     results.append(("LLM客户端", llm_result))
     results.append(("NL2SQL转换", nl2sql_result))
 
@@ -277,5 +301,5 @@ def main():
 
 
 if __name__ == "__main__":
-    success = main()
+    success = asyncio.run(main())
     sys.exit(0 if success else 1)
@@ -6,13 +6,27 @@
 2. 运行此脚本: python test_upload.py
 """
 
-import requests
-import pandas as pd
+import asyncio
+import csv
+import json
 import os
+import urllib.request
+from typing import TYPE_CHECKING, List, Optional
+
+# httpx 导入较慢,在确认服务器可用后再导入
+if TYPE_CHECKING:
+    import httpx
 
 # API 基础 URL
 BASE_URL = "http://localhost:8000"
 
+# 健康检查超时(秒)
+HEALTH_CHECK_TIMEOUT = 1
+
+# 客户端连接池: 空闲连接保持 keep-alive,供后续请求复用
+MAX_CONNECTIONS = 8
+MAX_KEEPALIVE_CONNECTIONS = 4
+
 
 def create_sample_csv():
     """创建一个示例 CSV 文件用于测试"""
@@ -23,28 +37,35 @@ def create_sample_csv():
         'salary': [50000, 60000, 75000, 55000, 65000],
         'department': ['IT', 'HR', 'IT', 'Sales', 'HR']
     }
-    df = pd.DataFrame(data)
-    df.to_csv('test_data.csv', index=False)
+    with open('test_data.csv', 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(data.keys())
+        writer.writerows(zip(*data.values()))
     print("✓ 已创建测试文件: test_data.csv")
     return 'test_data.csv'
 
 
-def test_upload_file(file_path: str):
-    """测试文件上传"""
-    print(f"\n开始上传文件: {file_path}")
+async def test_upload_file(client: "httpx.AsyncClient", file_name: str, content: bytes):
+    """
+    测试文件上传
 
-    with open(file_path, 'rb') as f:
-        files = {'file': (os.path.basename(file_path), f, 'text/csv')}
-        data = {
-            'name': '员工数据示例',
-            'description': '这是一个包含员工信息的测试数据集'
-        }
+    文件内容由调用方读取一次后传入,重复上传时不再访问磁盘。
+    样例文件很小,整体放在内存中即可;上传大文件时应改为传入文件对象,
+    httpx 会按 64KB 分块流式发送 multipart 请求体
+    """
+    print(f"\n开始上传文件: {file_name}")
 
-        response = requests.post(
-            f"{BASE_URL}/upload/",
-            files=files,
-            data=data
-        )
+    files = {'file': (file_name, content, 'text/csv')}
+    data = {
+        'name': '员工数据示例',
+        'description': '这是一个包含员工信息的测试数据集'
+    }
+
+    response = await client.post(
+        "/upload/",
+        files=files,
+        data=data
+    )
 
     if response.status_code == 200:
         result = response.json()
@@ -64,10 +85,10 @@ def test_upload_file(file_path: str):
         return None
 
 
-def test_list_datasets():
+async def test_list_datasets(client: "httpx.AsyncClient"):
     """测试获取数据集列表"""
+    response = await client.get("/upload/datasets")
     print("\n获取数据集列表:")
-    response = requests.get(f"{BASE_URL}/upload/datasets")
 
     if response.status_code == 200:
         datasets = response.json()
@@ -78,10 +99,10 @@ def test_list_datasets():
         print(f"✗ 获取失败: {response.status_code}")
 
 
-def test_get_dataset(dataset_id: int):
+async def test_get_dataset(client: "httpx.AsyncClient", dataset_id: int):
     """测试获取单个数据集详情"""
+    response = await client.get(f"/upload/datasets/{dataset_id}")
     print(f"\n获取数据集详情 (ID: {dataset_id}):")
-    response = requests.get(f"{BASE_URL}/upload/datasets/{dataset_id}")
 
     if response.status_code == 200:
         dataset = response.json()
@@ -92,10 +113,25 @@ def test_get_dataset(dataset_id: int):
         print(f"✗ 获取失败: {response.status_code}")
 
 
-def test_delete_dataset(dataset_id: int):
+async def test_get_datasets(client: "httpx.AsyncClient", dataset_ids: List[int]):
+    """测试按ID批量获取数据集详情 (一次请求)"""
+    ids = ",".join(map(str, dataset_ids))
+    response = await client.get("/upload/datasets", params={"ids": ids})
+    print(f"\n批量获取数据集详情 (IDs: {ids}):")
+
+    if response.status_code == 200:
+        for dataset in response.json():
+            print(f"✓ [{dataset['id']}] {dataset['name']}")
+            print(f"  描述: {dataset['description']}")
+            print(f"  文件路径: {dataset['file_path']}")
+    else:
+        print(f"✗ 获取失败: {response.status_code}")
+
+
+async def test_delete_dataset(client: "httpx.AsyncClient", dataset_id: int):
     """测试删除数据集"""
+    response = await client.delete(f"/upload/datasets/{dataset_id}")
     print(f"\n删除数据集 (ID: {dataset_id}):")
-    response = requests.delete(f"{BASE_URL}/upload/datasets/{dataset_id}")
 
     if response.status_code == 200:
         print(f"✓ 删除成功: {response.json()['message']}")
@@ -103,35 +139,51 @@ def test_delete_dataset(dataset_id: int):
         print(f"✗ 删除失败: {response.status_code}")
 
 
-def main():
-    print("=" * 50)
-    print("文件上传功能测试")
-    print("=" * 50)
+def check_server() -> Optional[str]:
+    """
+    使用标准库检查服务器是否运行
 
-    # 检查服务器是否运行
+    Returns:
+        服务器返回的欢迎信息,无法连接时返回 None
+    """
     try:
-        response = requests.get(f"{BASE_URL}/")
-        print(f"✓ 服务器正在运行: {response.json()['message']}\n")
-    except Exception as e:
-        print(f"✗ 无法连接到服务器，请先启动服务器:")
-        print("  uvicorn backend.main:app --reload")
-        return
+        with urllib.request.urlopen(f"{BASE_URL}/", timeout=HEALTH_CHECK_TIMEOUT) as response:
+            return json.load(response)['message']
+    except Exception:
+        return None
+
+
+async def run_tests():
+    """在共享的 AsyncClient 上依次执行上传相关测试"""
+    import httpx
 
-    # 创建测试文件
-    test_file = create_sample_csv()
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+    )
 
-    # 测试上传
-    dataset_id = test_upload_file(test_file)
+    # 所有请求共用一个客户端,复用连接池中的 keep-alive 连接
+    async with httpx.AsyncClient(base_url=BASE_URL, limits=limits) as client:
+        # 创建测试文件
+        test_file = create_sample_csv()
 
-    if dataset_id:
-        # 测试列表
-        test_list_datasets()
+        with open(test_file, 'rb') as f:
+            content = f.read()
 
-        # 测试获取详情
-        test_get_dataset(dataset_id)
+        # 测试上传
+        dataset_id = await test_upload_file(client, os.path.basename(test_file), content)
 
-        # 测试删除
-        # test_delete_dataset(dataset_id)
+        if dataset_id:
+            # 列表、单个详情和批量详情查询互不依赖,并发发送;
+            # 批量详情通过 ids 参数获取,多个数据集也只需一次请求
+            await asyncio.gather(
+                test_list_datasets(client),
+                test_get_dataset(client, dataset_id),
+                test_get_datasets(client, [dataset_id])
+            )
+
+            # 测试删除
+            # await test_delete_dataset(client, dataset_id)
 
     # 清理测试文件
     if os.path.exists(test_file):
@@ -139,5 +191,21 @@ def main():
         print(f"\n✓ 已清理测试文件: {test_file}")
 
 
+def main():
+    print("=" * 50)
+    print("文件上传功能测试")
+    print("=" * 50)
+
+    # 检查服务器是否运行,未运行时无需导入 httpx 即可退出
+    message = check_server()
+    if message is None:
+        print(f"✗ 无法连接到服务器，请先启动服务器:")
+        print("  uvicorn backend.main:app --reload")
+        return
+    print(f"✓ 服务器正在运行: {message}\n")
+
+    asyncio.run(run_tests())
+
+
 if __name__ == "__main__":
     main()
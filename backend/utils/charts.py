@@ -4,41 +4,231 @@ Generates Plotly chart configurations
 """
 
 import duckdb
-import pandas as pd
-from typing import Dict, List, Optional, Any
+import pyarrow as pa
+import pyarrow.compute as pc
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Tuple
+import os
 import uuid
 import math
 
+from backend.utils.duckdb_cache import CONNECTION_CACHE_SIZE, get_cursor
+
 
 def _sanitize_col(col_name: str) -> str:
     """
     Sanitize column names to prevent SQL injection
-    Use DuckDB double-quote protection
+    Use DuckDB double-quote protection; embedded quotes are doubled so the
+    name cannot terminate the identifier
     """
-    return f'"{col_name}"'
+    return '"' + col_name.replace('"', '""') + '"'
+
+
+def _column_values(table: pa.Table, name: str) -> list:
+    """
+    Convert a column of a (small, aggregated) Arrow result into Python values
+
+    DuckDB returns HUGEINT/DECIMAL sums as Arrow decimals; these are cast to
+    float so the values stay JSON-serializable, matching the pandas behaviour.
+    """
+    column = table.column(name)
+    if pa.types.is_decimal(column.type):
+        column = column.cast(pa.float64())
+    return column.to_pylist()
 
 
 def _get_duckdb_connection(file_path: str) -> duckdb.DuckDBPyConnection:
     """
-    Create DuckDB connection and load data file
+    Get a cursor on the cached DuckDB connection for a data file
+
+    The connection cache is shared with SQLExecutor, so a dataset is loaded
+    into memory once for both charts and SQL queries. Each thread reuses one
+    cursor per cached connection, so charts on the same file can run in
+    parallel threads; callers must not close it.
+
+    Args:
+        file_path: Data file path (supports CSV, Parquet)
+
+    Returns:
+        DuckDB cursor with the `data` relation available
+    """
+    return get_cursor(file_path, os.path.getmtime(file_path), "data")
+
+
+# Column types picked up by heatmap auto-selection
+NUMERIC_COLUMN_TYPES = frozenset({'INTEGER', 'BIGINT', 'DOUBLE', 'DECIMAL', 'FLOAT', 'HUGEINT'})
+
+
+@lru_cache(maxsize=CONNECTION_CACHE_SIZE)
+def _numeric_columns_cached(file_path: str, mtime: float) -> Tuple[str, ...]:
+    """
+    Look up the numeric columns of a data file once per file version
+
+    DESCRIBE on the Parquet view only binds the file footer, and on CSV it
+    reads the schema inferred when the table was loaded; neither scans data.
 
     Args:
         file_path: Data file path (supports CSV, Parquet)
+        mtime: File modification time; part of the cache key
 
     Returns:
-        DuckDB connection object
+        Numeric column names in table order
+    """
+    conn = get_cursor(file_path, mtime, "data")
+    # DESCRIBE rows start with (column_name, column_type, ...)
+    return tuple(
+        row[0] for row in conn.sql("DESCRIBE data").fetchall()
+        if row[1].upper() in NUMERIC_COLUMN_TYPES
+    )
+
+
+def _get_numeric_columns(file_path: str) -> List[str]:
+    """
+    Get the numeric column names of a data file (cached on path and mtime)
+
+    Args:
+        file_path: Data file path (supports CSV, Parquet)
+
+    Returns:
+        Numeric column names in table order
+    """
+    return list(_numeric_columns_cached(file_path, os.path.getmtime(file_path)))
+
+
+# Aggregations whose grand total equals the sum of the per-group values
+ADDITIVE_AGGS = frozenset({'sum', 'count'})
+
+
+def _top_k_with_total(
+    conn: duckdb.DuckDBPyConnection,
+    category_col: str,
+    value_expr: str,
+    top_k: int,
+    additive: bool
+) -> "tuple[list, list, Any]":
+    """
+    Aggregate the top K categories and the overall total in one scan
+
+    For additive aggregations (sum/count) the total is a window SUM over the
+    per-category values. Other aggregations (mean/median) cannot be summed,
+    so GROUPING SETS computes the grand total with the real aggregate in the
+    same hash aggregation. Either way the column is read only once.
+
+    Args:
+        conn: DuckDB connection with the `data` relation
+        category_col: Category column name
+        value_expr: Aggregate SQL expression for the value
+        top_k: Number of top categories to return
+        additive: Whether the total equals the sum of the per-category values
+
+    Returns:
+        (categories, values, total value over all categories)
+    """
+    category = _sanitize_col(category_col)
+    if additive:
+        sql = f"""
+            WITH agg AS (
+                SELECT
+                    {category} AS category,
+                    {value_expr} AS value
+                FROM data
+                WHERE {category} IS NOT NULL
+                GROUP BY 1
+            )
+            SELECT category, value, SUM(value) OVER () AS total
+            FROM agg
+            ORDER BY value DESC
+            LIMIT {top_k}
+        """
+    else:
+        sql = f"""
+            WITH agg AS (
+                SELECT
+                    {category} AS category,
+                    {value_expr} AS value,
+                    GROUPING({category}) AS is_total
+                FROM data
+                WHERE {category} IS NOT NULL
+                GROUP BY GROUPING SETS (({category}), ())
+            ),
+            ranked AS (
+                SELECT
+                    category,
+                    value,
+                    is_total,
+                    MAX(CASE WHEN is_total = 1 THEN value END) OVER () AS total
+                FROM agg
+            )
+            SELECT category, value, total
+            FROM ranked
+            WHERE is_total = 0
+            ORDER BY value DESC
+            LIMIT {top_k}
+        """
+
+    result = conn.sql(sql).arrow()
+    totals = _column_values(result, 'total')
+    total_value = totals[0] if totals else 0
+    return _column_values(result, 'category'), _column_values(result, 'value'), total_value
+
+
+# Number of Top-K aggregations kept so bar and pie charts on the same column share one query
+TOP_K_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=TOP_K_CACHE_SIZE)
+def _top_k_cached(
+    file_path: str,
+    mtime: float,
+    category_col: str,
+    value_col: str,
+    agg: str,
+    top_k: int
+) -> "tuple[tuple, tuple, Any]":
     """
-    conn = duckdb.connect(':memory:')
+    Run the Top-K aggregation once per file version and chart parameters
 
-    # Load data based on file type
-    if file_path.endswith('.parquet'):
-        conn.execute(f"CREATE TABLE data AS SELECT * FROM read_parquet('{file_path}')")
-    elif file_path.endswith('.csv'):
-        conn.execute(f"CREATE TABLE data AS SELECT * FROM read_csv_auto('{file_path}')")
+    Returns tuples so the cached result cannot be mutated by callers.
+    """
+    if value_col == 'count':
+        value_expr = 'COUNT(*)'
     else:
-        raise ValueError(f"Unsupported file type: {file_path}")
+        value_expr = f"{agg.upper()}({_sanitize_col(value_col)})"
+
+    categories, values, total_value = _top_k_with_total(
+        get_cursor(file_path, mtime, "data"), category_col, value_expr, top_k,
+        additive=value_col == 'count' or agg.lower() in ADDITIVE_AGGS
+    )
+    return tuple(categories), tuple(values), total_value
 
-    return conn
+
+def _aggregate_top_k(
+    file_path: str,
+    category_col: str,
+    value_col: str,
+    agg: str,
+    top_k: int
+) -> "tuple[list, list, Any]":
+    """
+    Top K categories and the overall total, shared by bar and pie charts
+
+    A dashboard showing both charts on the same column runs one DuckDB query;
+    the cache is keyed on the file's mtime so a rewritten file is re-read.
+
+    Args:
+        file_path: Data file path
+        category_col: Category column name
+        value_col: Value column name ('count' for row count)
+        agg: Aggregation method (sum|count|mean|median)
+        top_k: Number of top categories to return
+
+    Returns:
+        (categories, values, total value over all categories) as fresh lists
+    """
+    categories, values, total_value = _top_k_cached(
+        file_path, os.path.getmtime(file_path), category_col, value_col, agg, top_k
+    )
+    return list(categories), list(values), total_value
 
 
 def bar_chart_duckdb(
@@ -64,86 +254,63 @@ def bar_chart_duckdb(
     Returns:
         Dictionary with Plotly config and metadata
     """
-    conn = _get_duckdb_connection(file_path)
     notes = []
 
-    try:
-        # 1. Build SQL aggregation query
-        if value_col == 'count':
-            value_expr = 'COUNT(*)'
-        else:
-            agg_func = agg.upper()
-            value_expr = f"{agg_func}({_sanitize_col(value_col)})"
-
-        sql = f"""
-            SELECT
-                {_sanitize_col(category_col)} AS category,
-                {value_expr} AS value
-            FROM data
-            WHERE {_sanitize_col(category_col)} IS NOT NULL
-            GROUP BY 1
-            ORDER BY 2 DESC
-            LIMIT {top_k}
-        """
-
-        # 2. Execute query (DuckDB executes directly on files, extremely fast)
-        agg_df = conn.sql(sql).to_df()
-
-        # 3. Calculate 'Others' (optional)
-        total_query = f"SELECT {value_expr} AS total FROM data WHERE {_sanitize_col(category_col)} IS NOT NULL"
-        total_value = conn.sql(total_query).fetchone()[0]
-        top_sum = float(agg_df['value'].sum())
-        others_value = float(total_value) - top_sum
-
-        # Robustness check: warn if Others ratio is too high
-        if others_value > 0 and total_value > 0:
-            others_ratio = others_value / total_value
-            if others_ratio > 0.5:
-                notes.append("Too many categories, Top-K chart may not be representative")
-
-            # Add Others row
-            others_df = pd.DataFrame([{'category': 'Others', 'value': others_value}])
-            agg_df = pd.concat([agg_df, others_df], ignore_index=True)
-
-        # 4. Build Plotly JSON
-        trace = {
-            "type": "bar",
-            "x": agg_df['category'].tolist(),
-            "y": agg_df['value'].tolist(),
-            "marker": {"color": "#007aff"},
-            "text": [f"{v:.2f}" for v in agg_df['value']],
-            "textposition": "auto"
-        }
+    # 1. Top K categories and the overall total in one pass (shared with pie charts)
+    categories, values, total_value = _aggregate_top_k(file_path, category_col, value_col, agg, top_k)
+
+    # 2. Calculate 'Others' (optional)
+    present = [v for v in values if v is not None]
+    top_sum = float(sum(present))
+    others_value = float(total_value) - top_sum
+
+    # Robustness check: warn if Others ratio is too high
+    if others_value > 0 and total_value > 0:
+        others_ratio = others_value / total_value
+        if others_ratio > 0.5:
+            notes.append("Too many categories, Top-K chart may not be representative")
+
+        # Add Others row
+        categories.append('Others')
+        values.append(others_value)
+        present.append(others_value)
+
+    # 3. Build Plotly JSON
+    trace = {
+        "type": "bar",
+        "x": categories,
+        "y": values,
+        "marker": {"color": "#007aff"},
+        "text": [f"{v:.2f}" if v is not None else "" for v in values],
+        "textposition": "auto"
+    }
 
-        layout = {
-            "title": title or f"{category_col} Distribution",
-            "xaxis": {"title": category_col},
-            "yaxis": {"title": f"{agg}({value_col})" if value_col != 'count' else "Count"},
-            "template": "plotly_white"
-        }
+    layout = {
+        "title": title or f"{category_col} Distribution",
+        "xaxis": {"title": category_col},
+        "yaxis": {"title": f"{agg}({value_col})" if value_col != 'count' else "Count"},
+        "template": "plotly_white"
+    }
 
-        # 5. Return result
-        return {
-            "chart_id": str(uuid.uuid4()),
-            "chart_type": "bar",
-            "data": [trace],
-            "layout": layout,
-            "meta": {
-                "category_col": category_col,
-                "value_col": value_col,
-                "aggregation": agg,
-                "top_k": top_k,
-                "notes": notes
-            },
-            "summary": {
-                "total_value": float(total_value),
-                "top_value": float(agg_df['value'].max()),
-                "categories_count": len(agg_df)
-            }
+    # 4. Return result
+    return {
+        "chart_id": str(uuid.uuid4()),
+        "chart_type": "bar",
+        "data": [trace],
+        "layout": layout,
+        "meta": {
+            "category_col": category_col,
+            "value_col": value_col,
+            "aggregation": agg,
+            "top_k": top_k,
+            "notes": notes
+        },
+        "summary": {
+            "total_value": float(total_value),
+            "top_value": float(max(present)) if present else math.nan,
+            "categories_count": len(categories)
         }
-
-    finally:
-        conn.close()
+    }
 
 
 def timeseries_chart_duckdb(
@@ -175,120 +342,137 @@ def timeseries_chart_duckdb(
     conn = _get_duckdb_connection(file_path)
     notes = []
 
-    try:
-        # Map frequency to DuckDB date_trunc
-        freq_map = {'D': 'day', 'W': 'week', 'M': 'month'}
-        trunc_unit = freq_map.get(freq, 'day')
+    # Map frequency to DuckDB date_trunc
+    freq_map = {'D': 'day', 'W': 'week', 'M': 'month'}
+    trunc_unit = freq_map.get(freq, 'day')
 
-        # Build value expression
-        if value_col == 'count':
-            value_expr = 'COUNT(*)'
-        else:
-            agg_func = agg.upper()
-            value_expr = f"{agg_func}({_sanitize_col(value_col)})"
-
-        # Build time filter condition
-        where_clause = f"WHERE {_sanitize_col(time_col)} IS NOT NULL"
-        if time_range and len(time_range) == 2:
-            where_clause += f" AND {_sanitize_col(time_col)} BETWEEN '{time_range[0]}' AND '{time_range[1]}'"
-            notes.append(f"Time range: {time_range[0]} to {time_range[1]}")
-
-        # Build SQL
-        if group_by:
-            sql = f"""
-                SELECT
-                    date_trunc('{trunc_unit}', CAST({_sanitize_col(time_col)} AS TIMESTAMP)) AS time,
-                    {_sanitize_col(group_by)} AS series,
-                    {value_expr} AS value
-                FROM data
-                {where_clause}
-                GROUP BY 1, 2
-                ORDER BY 1, 2
-            """
-        else:
-            sql = f"""
-                SELECT
-                    date_trunc('{trunc_unit}', CAST({_sanitize_col(time_col)} AS TIMESTAMP)) AS time,
-                    {value_expr} AS value
-                FROM data
-                {where_clause}
-                GROUP BY 1
-                ORDER BY 1
-            """
-
-        # Execute query
-        result_df = conn.sql(sql).to_df()
-
-        # Return ISO 8601 format timestamp (avoid timezone issues)
-        result_df['time'] = pd.to_datetime(result_df['time']).dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-
-        # Build Plotly traces
-        if group_by and 'series' in result_df.columns:
-            traces = []
-            for series_name in result_df['series'].unique():
-                if pd.isna(series_name):
-                    continue
-                series_data = result_df[result_df['series'] == series_name]
-                traces.append({
-                    "type": "scatter",
-                    "mode": "lines+markers",
-                    "name": str(series_name),
-                    "x": series_data['time'].tolist(),
-                    "y": series_data['value'].tolist(),
-                    "line": {"width": 2},
-                    "marker": {"size": 4}
-                })
-        else:
-            traces = [{
+    # Build value expression
+    if value_col == 'count':
+        value_expr = 'COUNT(*)'
+    else:
+        agg_func = agg.upper()
+        value_expr = f"{agg_func}({_sanitize_col(value_col)})"
+
+    # Build time filter condition (range bounds are bound as parameters)
+    where_clause = f"WHERE {_sanitize_col(time_col)} IS NOT NULL"
+    params = []
+    if time_range and len(time_range) == 2:
+        where_clause += f" AND {_sanitize_col(time_col)} BETWEEN ? AND ?"
+        params = [time_range[0], time_range[1]]
+        notes.append(f"Time range: {time_range[0]} to {time_range[1]}")
+
+    # Build SQL
+    if group_by:
+        sql = f"""
+            SELECT
+                strftime(date_trunc('{trunc_unit}', CAST({_sanitize_col(time_col)} AS TIMESTAMP)), '%Y-%m-%dT%H:%M:%SZ') AS time,
+                {_sanitize_col(group_by)} AS series,
+                {value_expr} AS value
+            FROM data
+            {where_clause}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """
+    else:
+        sql = f"""
+            SELECT
+                strftime(date_trunc('{trunc_unit}', CAST({_sanitize_col(time_col)} AS TIMESTAMP)), '%Y-%m-%dT%H:%M:%SZ') AS time,
+                {value_expr} AS value
+            FROM data
+            {where_clause}
+            GROUP BY 1
+            ORDER BY 1
+        """
+
+    # Execute query
+    result = conn.sql(sql, params=params).arrow()
+
+    # Buckets come back as ISO 8601 strings formatted by DuckDB (avoid timezone issues);
+    # the fixed-width format sorts in the same order as the timestamps
+    times = _column_values(result, 'time')
+    values = _column_values(result, 'value')
+
+    # Build Plotly traces
+    if group_by and 'series' in result.column_names:
+        # One trace per series, in order of first appearance
+        series_points: Dict[Any, tuple] = {}
+        for series_name, time, value in zip(_column_values(result, 'series'), times, values):
+            if series_name is None:
+                continue
+            xs, ys = series_points.setdefault(series_name, ([], []))
+            xs.append(time)
+            ys.append(value)
+
+        traces = [
+            {
                 "type": "scatter",
                 "mode": "lines+markers",
-                "name": value_col,
-                "x": result_df['time'].tolist(),
-                "y": result_df['value'].tolist(),
-                "line": {"width": 2, "color": "#007aff"},
+                "name": str(series_name),
+                "x": xs,
+                "y": ys,
+                "line": {"width": 2},
                 "marker": {"size": 4}
-            }]
-
-        layout = {
-            "title": title or f"{value_col} over time",
-            "xaxis": {"title": "Date", "type": "date"},
-            "yaxis": {"title": f"{agg}({value_col})" if value_col != 'count' else "Count"},
-            "template": "plotly_white",
-            "hovermode": "x unified"
-        }
+            }
+            for series_name, (xs, ys) in series_points.items()
+        ]
+    else:
+        traces = [{
+            "type": "scatter",
+            "mode": "lines+markers",
+            "name": value_col,
+            "x": times,
+            "y": values,
+            "line": {"width": 2, "color": "#007aff"},
+            "marker": {"size": 4}
+        }]
+
+    layout = {
+        "title": title or f"{value_col} over time",
+        "xaxis": {"title": "Date", "type": "date"},
+        "yaxis": {"title": f"{agg}({value_col})" if value_col != 'count' else "Count"},
+        "template": "plotly_white",
+        "hovermode": "x unified"
+    }
 
-        # Calculate key metrics
-        values = result_df['value'].values
-        summary = {
-            "max_value": float(values.max()) if len(values) > 0 else 0,
-            "min_value": float(values.min()) if len(values) > 0 else 0,
-            "mean_value": float(values.mean()) if len(values) > 0 else 0,
-            "data_points": len(result_df)
-        }
+    # Calculate key metrics with Arrow compute kernels over the value column (NULLs skipped)
+    value_column = result.column('value')
+    if pa.types.is_decimal(value_column.type):
+        value_column = value_column.cast(pa.float64())
+    extremes = pc.min_max(value_column).as_py()
+    mean_value = pc.mean(value_column).as_py()
+    summary = {
+        "max_value": float(extremes['max']) if extremes['max'] is not None else 0,
+        "min_value": float(extremes['min']) if extremes['min'] is not None else 0,
+        "mean_value": float(mean_value) if mean_value is not None else 0,
+        "data_points": len(values)
+    }
 
-        # Calculate percent change (if enough data)
-        if len(values) >= 2:
-            pct_change = ((values[-1] - values[-2]) / values[-2] * 100) if values[-2] != 0 else 0
+    # Percent change between the last two periods (if enough data). A NULL
+    # bucket is not skipped over: if either of the last two periods has no
+    # value, pct_change is None rather than comparing two older points.
+    if len(values) >= 2:
+        last, previous = values[-1], values[-2]
+        if last is None or previous is None:
+            summary["pct_change"] = None
+        else:
+            pct_change = ((last - previous) / previous * 100) if previous != 0 else 0
             summary["pct_change"] = float(pct_change)
 
-        return {
-            "chart_id": str(uuid.uuid4()),
-            "chart_type": "timeseries",
-            "data": traces,
-            "layout": layout,
-            "meta": {
-                "time_col": time_col,
-                "value_col": value_col,
-                "freq": freq,
-                "aggregation": agg,
-                "group_by": group_by,
-                "notes": notes
-            },
-            "summary": summary
-        }
-
-    finally:
-        conn.close()
+    return {
+        "chart_id": str(uuid.uuid4()),
+        "chart_type": "timeseries",
+        "data": traces,
+        "layout": layout,
+        "meta": {
+            "time_col": time_col,
+            "value_col": value_col,
+            "freq": freq,
+            "aggregation": agg,
+            "group_by": group_by,
+            "notes": notes
+        },
+        "summary": summary
+    }
 
 
 def pie_chart_duckdb(
@@ -313,77 +497,53 @@ def pie_chart_duckdb(
     Returns:
         Dictionary with Plotly config and metadata
     """
-    conn = _get_duckdb_connection(file_path)
     notes = []
 
-    try:
-        # Build SQL
-        if value_col == 'count':
-            value_expr = 'COUNT(*)'
-        else:
-            agg_func = agg.upper()
-            value_expr = f"{agg_func}({_sanitize_col(value_col)})"
+    # Same aggregation as the bar chart (cached, so bar + pie on one column query once)
+    categories, values, total_value = _aggregate_top_k(file_path, category_col, value_col, agg, top_k)
 
-        sql = f"""
-            SELECT
-                {_sanitize_col(category_col)} AS category,
-                {value_expr} AS value
-            FROM data
-            WHERE {_sanitize_col(category_col)} IS NOT NULL
-            GROUP BY 1
-            ORDER BY 2 DESC
-            LIMIT {top_k}
-        """
-
-        agg_df = conn.sql(sql).to_df()
-
-        # Calculate Others
-        total_query = f"SELECT {value_expr} AS total FROM data WHERE {_sanitize_col(category_col)} IS NOT NULL"
-        total_value = conn.sql(total_query).fetchone()[0]
-        top_sum = float(agg_df['value'].sum())
-        others_value = float(total_value) - top_sum
+    # Calculate Others
+    top_sum = float(sum(v for v in values if v is not None))
+    others_value = float(total_value) - top_sum
 
-        if others_value > 0:
-            others_df = pd.DataFrame([{'category': 'Others', 'value': others_value}])
-            agg_df = pd.concat([agg_df, others_df], ignore_index=True)
+    if others_value > 0:
+        categories.append('Others')
+        values.append(others_value)
 
-            if others_value / total_value > 0.5:
-                notes.append("Too many categories, consider using bar chart instead")
+        if others_value / total_value > 0.5:
+            notes.append("Too many categories, consider using bar chart instead")
 
-        # Build Plotly pie chart
-        trace = {
-            "type": "pie",
-            "labels": agg_df['category'].tolist(),
-            "values": agg_df['value'].tolist(),
-            "textinfo": "label+percent",
-            "hovertemplate": "<b>%{label}</b><br>Value: %{value}<br>Percent: %{percent}<extra></extra>"
-        }
+    # Build Plotly pie chart
+    trace = {
+        "type": "pie",
+        "labels": categories,
+        "values": values,
+        "textinfo": "label+percent",
+        "hovertemplate": "<b>%{label}</b><br>Value: %{value}<br>Percent: %{percent}<extra></extra>"
+    }
 
-        layout = {
-            "title": title or f"{category_col} Distribution",
-            "template": "plotly_white"
-        }
+    layout = {
+        "title": title or f"{category_col} Distribution",
+        "template": "plotly_white"
+    }
 
-        return {
-            "chart_id": str(uuid.uuid4()),
-            "chart_type": "pie",
-            "data": [trace],
-            "layout": layout,
-            "meta": {
-                "category_col": category_col,
-                "value_col": value_col,
-                "aggregation": agg,
-                "top_k": top_k,
-                "notes": notes
-            },
-            "summary": {
-                "total_value": float(total_value),
-                "categories_count": len(agg_df)
-            }
+    return {
+        "chart_id": str(uuid.uuid4()),
+        "chart_type": "pie",
+        "data": [trace],
+        "layout": layout,
+        "meta": {
+            "category_col": category_col,
+            "value_col": value_col,
+            "aggregation": agg,
+            "top_k": top_k,
+            "notes": notes
+        },
+        "summary": {
+            "total_value": float(total_value),
+            "categories_count": len(categories)
         }
-
-    finally:
-        conn.close()
+    }
 
 
 def distribution_chart_duckdb(
@@ -408,116 +568,110 @@ def distribution_chart_duckdb(
     conn = _get_duckdb_connection(file_path)
     notes = []
 
-    try:
-        # Get basic statistics
-        stats_sql = f"""
-            SELECT
-                MIN({_sanitize_col(value_col)}) as min_val,
-                MAX({_sanitize_col(value_col)}) as max_val,
-                AVG({_sanitize_col(value_col)}) as mean_val,
-                MEDIAN({_sanitize_col(value_col)}) as median_val,
-                STDDEV({_sanitize_col(value_col)}) as std_val,
-                COUNT(*) as count_val
-            FROM data
-            WHERE {_sanitize_col(value_col)} IS NOT NULL
-        """
-
-        stats = conn.sql(stats_sql).fetchone()
-        min_val, max_val, mean_val, median_val, std_val, count_val = stats
-
-        # Auto-calculate bins (using Freedman-Diaconis rule)
-        if bins is None:
-            # IQR based bin width
-            iqr_sql = f"""
-                SELECT
-                    PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY {_sanitize_col(value_col)}) -
-                    PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY {_sanitize_col(value_col)}) as iqr
-                FROM data
-                WHERE {_sanitize_col(value_col)} IS NOT NULL
-            """
-            iqr = conn.sql(iqr_sql).fetchone()[0]
-
-            if iqr > 0:
-                bin_width = 2 * iqr / (count_val ** (1/3))
-                bins = max(10, min(50, int((max_val - min_val) / bin_width)))
-            else:
-                bins = int(math.sqrt(count_val))
+    # Get basic statistics; when bins must be auto-calculated, the IQR is
+    # estimated in the same scan (approx_quantile streams a t-digest, an
+    # exact percentile would need the whole column sorted)
+    iqr_expr = (
+        f"approx_quantile({_sanitize_col(value_col)}, 0.75) - "
+        f"approx_quantile({_sanitize_col(value_col)}, 0.25)"
+        if bins is None else "NULL"
+    )
+    stats_sql = f"""
+        SELECT
+            MIN({_sanitize_col(value_col)}) as min_val,
+            MAX({_sanitize_col(value_col)}) as max_val,
+            AVG({_sanitize_col(value_col)}) as mean_val,
+            MEDIAN({_sanitize_col(value_col)}) as median_val,
+            STDDEV({_sanitize_col(value_col)}) as std_val,
+            COUNT(*) as count_val,
+            {iqr_expr} as iqr_val
+        FROM data
+        WHERE {_sanitize_col(value_col)} IS NOT NULL
+    """
 
-            notes.append(f"Auto-calculated bins: {bins}")
+    stats = conn.sql(stats_sql).fetchone()
+    min_val, max_val, mean_val, median_val, std_val, count_val, iqr = stats
 
-        # Build histogram SQL
-        bin_width = (max_val - min_val) / bins
-        hist_sql = f"""
-            SELECT
-                FLOOR(({_sanitize_col(value_col)} - {min_val}) / {bin_width}) * {bin_width} + {min_val} as bin_start,
-                COUNT(*) as count
-            FROM data
-            WHERE {_sanitize_col(value_col)} IS NOT NULL
-            GROUP BY 1
-            ORDER BY 1
-        """
-
-        hist_df = conn.sql(hist_sql).to_df()
+    # Auto-calculate bins (using Freedman-Diaconis rule with the IQR based bin width)
+    if bins is None:
+        if iqr > 0:
+            bin_width = 2 * iqr / (count_val ** (1/3))
+            bins = max(10, min(50, int((max_val - min_val) / bin_width)))
+        else:
+            bins = int(math.sqrt(count_val))
+
+        notes.append(f"Auto-calculated bins: {bins}")
+
+    # Build histogram SQL (bin origin and width are bound as parameters)
+    bin_width = (max_val - min_val) / bins
+    hist_sql = f"""
+        SELECT
+            FLOOR(({_sanitize_col(value_col)} - $min_val) / $bin_width) * $bin_width + $min_val as bin_start,
+            COUNT(*) as count
+        FROM data
+        WHERE {_sanitize_col(value_col)} IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+    """
 
-        # Build Plotly histogram
-        trace = {
-            "type": "bar",
-            "x": hist_df['bin_start'].tolist(),
-            "y": hist_df['count'].tolist(),
-            "marker": {"color": "#007aff"},
-            "name": "Frequency"
-        }
+    hist = conn.sql(hist_sql, params={"min_val": min_val, "bin_width": bin_width}).arrow()
 
-        # Add mean and median lines
-        shapes = [
-            {
-                "type": "line",
-                "x0": mean_val, "x1": mean_val,
-                "y0": 0, "y1": 1,
-                "yref": "paper",
-                "line": {"color": "red", "width": 2, "dash": "dash"},
-                "name": "Mean"
-            },
-            {
-                "type": "line",
-                "x0": median_val, "x1": median_val,
-                "y0": 0, "y1": 1,
-                "yref": "paper",
-                "line": {"color": "green", "width": 2, "dash": "dash"},
-                "name": "Median"
-            }
-        ]
+    # Build Plotly histogram
+    trace = {
+        "type": "bar",
+        "x": _column_values(hist, 'bin_start'),
+        "y": _column_values(hist, 'count'),
+        "marker": {"color": "#007aff"},
+        "name": "Frequency"
+    }
 
-        layout = {
-            "title": title or f"Distribution of {value_col}",
-            "xaxis": {"title": value_col},
-            "yaxis": {"title": "Frequency"},
-            "template": "plotly_white",
-            "shapes": shapes
+    # Add mean and median lines
+    shapes = [
+        {
+            "type": "line",
+            "x0": mean_val, "x1": mean_val,
+            "y0": 0, "y1": 1,
+            "yref": "paper",
+            "line": {"color": "red", "width": 2, "dash": "dash"},
+            "name": "Mean"
+        },
+        {
+            "type": "line",
+            "x0": median_val, "x1": median_val,
+            "y0": 0, "y1": 1,
+            "yref": "paper",
+            "line": {"color": "green", "width": 2, "dash": "dash"},
+            "name": "Median"
         }
+    ]
+
+    layout = {
+        "title": title or f"Distribution of {value_col}",
+        "xaxis": {"title": value_col},
+        "yaxis": {"title": "Frequency"},
+        "template": "plotly_white",
+        "shapes": shapes
+    }
 
-        return {
-            "chart_id": str(uuid.uuid4()),
-            "chart_type": "distribution",
-            "data": [trace],
-            "layout": layout,
-            "meta": {
-                "value_col": value_col,
-                "bins": bins,
-                "notes": notes
-            },
-            "summary": {
-                "min": float(min_val),
-                "max": float(max_val),
-                "mean": float(mean_val),
-                "median": float(median_val),
-                "std": float(std_val),
-                "count": int(count_val)
-            }
+    return {
+        "chart_id": str(uuid.uuid4()),
+        "chart_type": "distribution",
+        "data": [trace],
+        "layout": layout,
+        "meta": {
+            "value_col": value_col,
+            "bins": bins,
+            "notes": notes
+        },
+        "summary": {
+            "min": float(min_val),
+            "max": float(max_val),
+            "mean": float(mean_val),
+            "median": float(median_val),
+            "std": float(std_val),
+            "count": int(count_val)
         }
-
-    finally:
-        conn.close()
+    }
 
 
 def heatmap_chart_duckdb(
@@ -539,85 +693,126 @@ def heatmap_chart_duckdb(
     conn = _get_duckdb_connection(file_path)
     notes = []
 
-    try:
-        # If columns not specified, auto-select numeric columns
-        if columns is None:
-            schema_sql = "DESCRIBE data"
-            schema_df = conn.sql(schema_sql).to_df()
-            numeric_types = ['INTEGER', 'BIGINT', 'DOUBLE', 'DECIMAL', 'FLOAT', 'HUGEINT']
-            columns = schema_df[schema_df['column_type'].str.upper().isin(numeric_types)]['column_name'].tolist()
-            notes.append(f"Auto-selected {len(columns)} numeric columns")
-
-        if len(columns) < 2:
-            raise ValueError("At least 2 numeric columns required for correlation matrix")
-
-        if len(columns) > 20:
-            notes.append("Too many columns, consider dimensionality reduction or select key columns")
-            columns = columns[:20]
-
-        # Read data and calculate correlation matrix (using pandas corr method)
-        select_cols = ", ".join([_sanitize_col(col) for col in columns])
-        data_sql = f"SELECT {select_cols} FROM data"
-        df = conn.sql(data_sql).to_df()
-
-        # Calculate correlation matrix
-        corr_matrix = df.corr()
-
-        # Build Plotly heatmap
-        trace = {
-            "type": "heatmap",
-            "z": corr_matrix.values.tolist(),
-            "x": corr_matrix.columns.tolist(),
-            "y": corr_matrix.index.tolist(),
-            "colorscale": "RdBu",
-            "zmid": 0,
-            "zmin": -1,
-            "zmax": 1,
-            "text": [[f"{val:.2f}" for val in row] for row in corr_matrix.values],
-            "texttemplate": "%{text}",
-            "textfont": {"size": 10},
-            "hovertemplate": "X: %{x}<br>Y: %{y}<br>Correlation: %{z:.3f}<extra></extra>"
-        }
+    # If columns not specified, auto-select numeric columns
+    if columns is None:
+        columns = _get_numeric_columns(file_path)
+        notes.append(f"Auto-selected {len(columns)} numeric columns")
+
+    if len(columns) < 2:
+        raise ValueError("At least 2 numeric columns required for correlation matrix")
+
+    if len(columns) > 20:
+        notes.append("Too many columns, consider dimensionality reduction or select key columns")
+        columns = columns[:20]
+
+    # Calculate the correlation matrix in DuckDB: one corr() aggregate per
+    # column pair (upper triangle incl. diagonal), fetched as a single row
+    pairs = [(i, j) for i in range(len(columns)) for j in range(i, len(columns))]
+    corr_sql = "SELECT " + ", ".join(
+        f"corr({_sanitize_col(columns[i])}, {_sanitize_col(columns[j])})" for i, j in pairs
+    ) + " FROM data"
+    corr_row = conn.sql(corr_sql).fetchone()
+
+    # Same conventions as pandas DataFrame.corr(): undefined correlations
+    # are NaN, the diagonal is exactly 1 and values are clipped to [-1, 1]
+    n = len(columns)
+    corr_matrix = [[math.nan] * n for _ in range(n)]
+    for (i, j), value in zip(pairs, corr_row):
+        if value is None or math.isnan(value):
+            continue
+        corr_matrix[i][j] = corr_matrix[j][i] = 1.0 if i == j else max(-1.0, min(1.0, value))
+
+    # Build Plotly heatmap
+    trace = {
+        "type": "heatmap",
+        "z": corr_matrix,
+        "x": list(columns),
+        "y": list(columns),
+        "colorscale": "RdBu",
+        "zmid": 0,
+        "zmin": -1,
+        "zmax": 1,
+        "text": [[f"{val:.2f}" for val in row] for row in corr_matrix],
+        "texttemplate": "%{text}",
+        "textfont": {"size": 10},
+        "hovertemplate": "X: %{x}<br>Y: %{y}<br>Correlation: %{z:.3f}<extra></extra>"
+    }
 
-        layout = {
-            "title": title or "Correlation Matrix",
-            "xaxis": {"title": "", "side": "bottom"},
-            "yaxis": {"title": ""},
-            "template": "plotly_white",
-            "width": 600 + len(columns) * 30,
-            "height": 600 + len(columns) * 30
-        }
+    layout = {
+        "title": title or "Correlation Matrix",
+        "xaxis": {"title": "", "side": "bottom"},
+        "yaxis": {"title": ""},
+        "template": "plotly_white",
+        "width": 600 + len(columns) * 30,
+        "height": 600 + len(columns) * 30
+    }
 
-        # Find strongest correlations (excluding diagonal)
-        corr_values = []
-        for i in range(len(columns)):
-            for j in range(i + 1, len(columns)):
-                corr_values.append({
-                    "col1": columns[i],
-                    "col2": columns[j],
-                    "correlation": float(corr_matrix.iloc[i, j])
-                })
-
-        corr_values.sort(key=lambda x: abs(x['correlation']), reverse=True)
-        top_correlations = corr_values[:5]
-
-        return {
-            "chart_id": str(uuid.uuid4()),
-            "chart_type": "heatmap",
-            "data": [trace],
-            "layout": layout,
-            "meta": {
-                "columns": columns,
-                "notes": notes
-            },
-            "summary": {
-                "columns_count": len(columns),
-                "top_correlations": top_correlations
-            }
+    # Find strongest correlations (excluding diagonal)
+    corr_values = []
+    for i in range(len(columns)):
+        for j in range(i + 1, len(columns)):
+            corr_values.append({
+                "col1": columns[i],
+                "col2": columns[j],
+                "correlation": corr_matrix[i][j]
+            })
+
+    corr_values.sort(key=lambda x: abs(x['correlation']), reverse=True)
+    top_correlations = corr_values[:5]
+
+    return {
+        "chart_id": str(uuid.uuid4()),
+        "chart_type": "heatmap",
+        "data": [trace],
+        "layout": layout,
+        "meta": {
+            "columns": columns,
+            "notes": notes
+        },
+        "summary": {
+            "columns_count": len(columns),
+            "top_correlations": top_correlations
         }
+    }
+
 
-    finally:
-        conn.close()
+CHART_GENERATORS = {
+    'bar': bar_chart_duckdb,
+    'timeseries': timeseries_chart_duckdb,
+    'pie': pie_chart_duckdb,
+    'distribution': distribution_chart_duckdb,
+    'heatmap': heatmap_chart_duckdb
+}
+
+
+def generate_charts(
+    file_path: str,
+    specs: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Generate several charts for the same data file
+
+    All charts run on the file's cached DuckDB connection, so the file is
+    opened (and a CSV parsed) once and the queries share DuckDB's buffer pool.
+
+    Args:
+        file_path: Data file path
+        specs: Chart specs, each a dict with 'chart_type' plus chart-specific parameters
+
+    Returns:
+        Chart configuration dictionaries, in the order of specs
+    """
+    # Validate every spec before running any query
+    for spec in specs:
+        if spec.get('chart_type') not in CHART_GENERATORS:
+            raise ValueError(f"Unsupported chart type: {spec.get('chart_type')}")
+
+    results = []
+    for spec in specs:
+        params = dict(spec)
+        generator = CHART_GENERATORS[params.pop('chart_type')]
+        results.append(generator(file_path, **params))
+    return results
 
 
 def generate_chart(
@@ -636,16 +831,4 @@ def generate_chart(
     Returns:
         Chart configuration dictionary
     """
-    chart_generators = {
-        'bar': bar_chart_duckdb,
-        'timeseries': timeseries_chart_duckdb,
-        'pie': pie_chart_duckdb,
-        'distribution': distribution_chart_duckdb,
-        'heatmap': heatmap_chart_duckdb
-    }
-
-    if chart_type not in chart_generators:
-        raise ValueError(f"Unsupported chart type: {chart_type}")
-
-    generator = chart_generators[chart_type]
-    return generator(file_path, **kwargs)
+    return generate_charts(file_path, [{'chart_type': chart_type, **kwargs}])[0]
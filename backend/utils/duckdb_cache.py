@@ -0,0 +1,133 @@
+"""
+DuckDB 数据文件连接缓存
+图表生成和SQL查询共用,同一数据文件在内存中只加载一份
+"""
+
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import duckdb
+
+from backend.utils.excel_reader import read_excel_table
+
+
+# 保持打开的数据文件连接数;每个连接持有一份已加载的数据表
+CONNECTION_CACHE_SIZE = 16
+
+# 正在加载的缓存键 -> 加载锁;lru_cache 不合并并发的未命中,同一文件的并发首次查询在锁上排队
+_load_locks = {}
+_load_locks_guard = threading.Lock()
+
+
+class _LoadedData:
+    """
+    已加载数据文件的DuckDB连接,以及各线程在其上的游标
+
+    DuckDB 0.9 的连接会保留创建过的所有游标,每次查询新建游标会持续占用内存;
+    每个线程只创建一个游标并重复使用。连接被逐出缓存后,游标随对象一起释放
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection):
+        self.conn = conn
+        self._local = threading.local()
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """获取当前线程的游标 (首次调用时创建)"""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        return cursor
+
+
+def get_cursor(file_path: str, mtime: float, table_name: str) -> duckdb.DuckDBPyConnection:
+    """
+    获取已加载数据文件的DuckDB游标 (连接按文件版本缓存,游标按线程复用)
+
+    Args:
+        file_path: 数据文件路径
+        mtime: 文件修改时间
+        table_name: DuckDB中的表名
+
+    Returns:
+        当前线程的DuckDB游标 (同一线程的后续调用返回同一游标,调用方不应关闭)
+
+    Raises:
+        ValueError: 文件类型不支持
+        duckdb.Error: 文件读取失败
+    """
+    key = (file_path, mtime, table_name)
+    with _load_locks_guard:
+        lock = _load_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            loaded = _load_data(file_path, mtime, table_name)
+    finally:
+        with _load_locks_guard:
+            if _load_locks.get(key) is lock:
+                del _load_locks[key]
+    return loaded.cursor()
+
+
+@lru_cache(maxsize=CONNECTION_CACHE_SIZE)
+def _load_data(file_path: str, mtime: float, table_name: str) -> _LoadedData:
+    """
+    创建DuckDB内存连接并把数据文件加载为表 (按文件版本缓存)
+
+    同一数据集的后续查询复用已加载的表,不再重复解析文件;
+    mtime 是缓存键的一部分,文件被重写后重新加载。
+    Parquet 注册为视图以保留列裁剪和过滤下推;CSV、JSON、Excel 没有下推,
+    在缓存的连接中只解析一次为表
+
+    lru_cache 按实参的写法区分缓存键,需按位置传入全部三个参数
+
+    Args:
+        file_path: 数据文件路径
+        mtime: 文件修改时间
+        table_name: DuckDB中的表名
+
+    Returns:
+        已加载数据的连接
+
+    Raises:
+        ValueError: 文件类型不支持
+        duckdb.Error: 文件读取失败
+    """
+    conn = duckdb.connect(':memory:')
+    # 缓存Parquet元数据 (footer/统计信息),视图上的重复查询不再每次重新解析;
+    # 线程数沿用DuckDB默认的CPU核数,保留插入顺序以保证无ORDER BY时的行顺序不变
+    conn.execute("SET enable_object_cache=true")
+    quoted_table = '"' + table_name.replace('"', '""') + '"'
+
+    # 根据文件类型加载数据
+    file_ext = Path(file_path).suffix.lower()
+
+    try:
+        if file_ext == '.csv':
+            conn.execute(
+                f"CREATE TABLE {quoted_table} AS SELECT * FROM read_csv_auto(?)", [file_path]
+            )
+        elif file_ext in ['.xlsx', '.xls']:
+            # Excel文件:先用calamine(未安装时退回openpyxl)读取为Arrow表,再复制为DuckDB表
+            # (register 的视图只对当前连接可见,游标看不到)
+            conn.register('excel_source', read_excel_table(file_path))
+            conn.execute(f"CREATE TABLE {quoted_table} AS SELECT * FROM excel_source")
+            conn.unregister('excel_source')
+        elif file_ext == '.json':
+            conn.execute(
+                f"CREATE TABLE {quoted_table} AS SELECT * FROM read_json_auto(?)", [file_path]
+            )
+        elif file_ext == '.parquet':
+            # Parquet注册为视图,查询只读取用到的列并下推过滤条件;
+            # 视图定义不支持预处理参数,路径按字符串字面量转义
+            path_literal = file_path.replace("'", "''")
+            conn.execute(
+                f"CREATE VIEW {quoted_table} AS SELECT * FROM read_parquet('{path_literal}')"
+            )
+        else:
+            raise ValueError(f"Unsupported file type: {file_ext}")
+    except Exception:
+        conn.close()
+        raise
+
+    return _LoadedData(conn)
@@ -0,0 +1,114 @@
+"""
+Excel 读取工具
+优先使用 python-calamine (Rust 实现) 读取工作表，未安装时退回 openpyxl
+读取结果直接构建为 Arrow 表，可零拷贝注册到 DuckDB
+"""
+
+from typing import Iterator, List, Sequence
+
+import pyarrow as pa
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+
+def _normalize_cell(value):
+    """
+    将 calamine 的单元格值转换为与 openpyxl 一致的形式
+
+    calamine 用空字符串表示空单元格，数字统一为 float；
+    这里还原为 None 和整数，保证 DuckDB 推断出的列类型不变
+    """
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_excel_rows(file_path: str) -> Iterator[Sequence]:
+    """
+    逐行读取 Excel 第一个工作表
+
+    Args:
+        file_path: Excel 文件路径 (.xlsx / .xls)
+
+    Returns:
+        Iterator: 每行单元格值组成的序列，第一行为表头
+    """
+    if CalamineWorkbook is not None:
+        sheet = CalamineWorkbook.from_path(file_path).get_sheet_by_index(0)
+        for row in sheet.to_python():
+            yield [_normalize_cell(value) for value in row]
+        return
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _column_names(header: Sequence) -> List[str]:
+    """
+    根据表头行生成列名，空表头按位置命名，重复列名追加序号
+
+    Args:
+        header: 表头行的单元格值
+
+    Returns:
+        List[str]: 唯一的列名列表
+    """
+    names = []
+    seen = set()
+    for i, value in enumerate(header):
+        base = str(value) if value is not None else f"column{i}"
+        name, n = base, 1
+        while name in seen:
+            name = f"{base}_{n}"
+            n += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _to_arrow_array(values: list) -> pa.Array:
+    """
+    将一列值转换为 Arrow 数组，类型不一致的列退回为字符串列
+    """
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def read_excel_table(file_path: str) -> pa.Table:
+    """
+    读取 Excel 第一个工作表为 Arrow 表
+
+    一次遍历把行数据收集为列，不经过临时 CSV 的序列化和重新解析；
+    第一行作为表头
+
+    Args:
+        file_path: Excel 文件路径 (.xlsx / .xls)
+
+    Returns:
+        pa.Table: 工作表数据
+    """
+    rows = iter_excel_rows(file_path)
+    header = next(rows, None)
+    if header is None:
+        return pa.table({})
+
+    names = _column_names(header)
+    columns = [[] for _ in names]
+    for row in rows:
+        # 短行补 None，超出表头的单元格忽略
+        for i, column in enumerate(columns):
+            column.append(row[i] if i < len(row) else None)
+
+    return pa.Table.from_arrays([_to_arrow_array(c) for c in columns], names=names)
@@ -0,0 +1,48 @@
+"""
+数据文件存在性缓存
+避免每个请求都在事件循环中执行 stat 系统调用
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Tuple
+
+
+# 缓存有效期(秒)
+EXISTS_TTL = 5.0
+
+# path -> (检查时间, 是否存在)
+_exists_cache: Dict[str, Tuple[float, bool]] = {}
+
+
+async def file_exists(path: str) -> bool:
+    """
+    检查文件是否存在 (带TTL缓存)
+
+    缓存未命中时在线程池中执行 os.path.exists,不阻塞事件循环
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        文件是否存在
+    """
+    now = time.monotonic()
+    cached = _exists_cache.get(path)
+    if cached is not None and now - cached[0] < EXISTS_TTL:
+        return cached[1]
+
+    exists = await asyncio.to_thread(os.path.exists, path)
+    _exists_cache[path] = (now, exists)
+    return exists
+
+
+def invalidate(path: str) -> None:
+    """
+    使某个路径的缓存失效 (文件上传或删除后调用)
+
+    Args:
+        path: 文件路径
+    """
+    _exists_cache.pop(path, None)
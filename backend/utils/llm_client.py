@@ -3,13 +3,75 @@ LLM客户端工具模块
 提供统一的LLM调用接口,支持OpenAI API兼容的服务
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from collections import OrderedDict
+import asyncio
+import importlib.util
+import re
+from functools import lru_cache
 import httpx
-import json
+import orjson
 from backend.config import get_settings
 
 settings = get_settings()
 
+# LLM回复中的markdown代码块 (```sql ... ```),允许前后有说明文字、语言标记大小写不限、缺少结束标记
+SQL_CODE_BLOCK_PATTERN = re.compile(r"```(?:sql)?\s*(.*?)\s*(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+# 共享HTTP客户端的连接池大小
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 50
+
+# 安装了 h2 时启用 HTTP/2,同一连接可复用多个并发请求
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 所有LLMClient共享的HTTP客户端,每个事件循环一个 (连接池绑定创建它的事件循环)
+_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """
+    获取当前事件循环共享的HTTP客户端 (懒加载)
+
+    连接在请求之间保持 keep-alive,避免每次调用都重新建立 TCP/TLS 连接。
+    连接池绑定创建它的事件循环,每个事件循环使用各自的客户端 (如多次 asyncio.run、
+    测试客户端在独立线程中运行的事件循环),不会因事件循环切换而丢弃仍在使用的客户端
+
+    Returns:
+        httpx.AsyncClient实例
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        # 已关闭的事件循环上的客户端无法再 aclose,只能丢弃
+        for stale_loop in [l for l in _http_clients if l.is_closed()]:
+            del _http_clients[stale_loop]
+        client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def close_http_client() -> None:
+    """
+    关闭所有共享的HTTP客户端 (应用关闭时调用)
+
+    当前事件循环的客户端直接关闭;其他仍在运行的事件循环上的客户端提交到各自的循环中关闭
+    """
+    loop = asyncio.get_running_loop()
+    clients = list(_http_clients.items())
+    _http_clients.clear()
+    for client_loop, client in clients:
+        if client_loop is loop:
+            await client.aclose()
+        elif client_loop.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), client_loop))
+
 
 class LLMClient:
     """
@@ -44,6 +106,39 @@ class LLMClient:
         # 构建完整的API端点
         self.chat_endpoint = f"{self.base_url}/chat/completions"
 
+    def _build_request(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int],
+        stop: Optional[List[str]],
+        **kwargs
+    ) -> tuple:
+        """
+        构建请求头和请求体
+
+        Returns:
+            (headers, payload)
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": temperature,
+            **kwargs
+        }
+
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        if stop:
+            payload["stop"] = stop
+
+        return headers, payload
+
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -67,33 +162,73 @@ class LLMClient:
 
         Raises:
             httpx.HTTPError: HTTP请求失败
-            json.JSONDecodeError: 响应解析失败
+            orjson.JSONDecodeError: 响应解析失败
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        headers, payload = self._build_request(messages, temperature, max_tokens, stop, **kwargs)
+
+        client = _get_http_client()
+        response = await client.post(
+            self.chat_endpoint,
+            headers=headers,
+            content=orjson.dumps(payload),
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "temperature": temperature,
-            **kwargs
-        }
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.1,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式调用LLM聊天补全API
 
-        if max_tokens:
-            payload["max_tokens"] = max_tokens
-        if stop:
-            payload["stop"] = stop
+        请求 stream=True,逐个解析 Server-Sent Events 的 "data: {...}" 帧,
+        生成内容增量,调用方无需等待完整响应即可开始处理
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                self.chat_endpoint,
-                headers=headers,
-                json=payload
-            )
+        Args:
+            messages: 消息列表 [{"role": "user", "content": "..."}]
+            temperature: 温度参数 (0.0-2.0, 越低越确定)
+            max_tokens: 最大生成token数
+            stop: 停止词列表
+            **kwargs: 其他模型参数
+
+        Yields:
+            LLM生成的文本片段
+
+        Raises:
+            httpx.HTTPError: HTTP请求失败
+            orjson.JSONDecodeError: 事件解析失败
+        """
+        headers, payload = self._build_request(messages, temperature, max_tokens, stop, **kwargs)
+        payload["stream"] = True
+
+        client = _get_http_client()
+        async with client.stream(
+            "POST",
+            self.chat_endpoint,
+            headers=headers,
+            content=orjson.dumps(payload),
+            timeout=self.timeout
+        ) as response:
             response.raise_for_status()
-            return response.json()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                choices = orjson.loads(data).get("choices")
+                if not choices:
+                    continue
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
 
     async def extract_content(
         self,
@@ -114,6 +249,111 @@ class LLMClient:
         return response["choices"][0]["message"]["content"]
 
 
+def _schema_key(schema: List[Dict[str, Any]]) -> tuple:
+    """由提示词用到的列信息构成的可哈希缓存键"""
+    return tuple(
+        (col['name'], col['dtype'], col.get('non_null_count'),
+         col.get('unique_count'), col.get('min'), col.get('max'))
+        for col in schema
+    )
+
+
+@lru_cache(maxsize=64)
+def _nl2sql_system_prompt(schema_key: tuple, table_name: str) -> str:
+    """
+    构建NL2SQL系统提示词 (带缓存)
+
+    系统提示词只依赖数据集schema,同一数据集的每个问题都复用缓存的字符串
+
+    Args:
+        schema_key: _schema_key() 生成的schema缓存键
+        table_name: 表名
+
+    Returns:
+        系统提示词
+    """
+    # 格式化schema信息
+    parts = ["Table: {}\nColumns:\n".format(table_name)]
+    for name, dtype, non_null_count, unique_count, min_value, max_value in schema_key:
+        parts.append(f"- {name} ({dtype})")
+        if non_null_count:
+            parts.append(f" - {non_null_count} non-null values")
+        if unique_count:
+            parts.append(f", {unique_count} unique")
+        if min_value is not None:
+            parts.append(f", range: [{min_value:.2f}, {max_value:.2f}]")
+        parts.append("\n")
+    schema_str = "".join(parts)
+
+    # 构建系统提示
+    system_prompt = f"""You are an expert SQL query generator for DuckDB.
+
+Task: Convert natural language questions to SQL queries.
+
+{schema_str}
+
+Requirements:
+1. Generate ONLY the SQL query, no explanations
+2. Use double quotes for column names with spaces: "column name"
+3. Always use WHERE clause to filter NULL values when appropriate
+4. Use appropriate aggregation functions (COUNT, SUM, AVG, etc.)
+5. Add ORDER BY and LIMIT when relevant
+6. Return the query in a single line
+7. Do NOT include semicolon at the end
+
+Examples:
+Q: How many rows are there?
+A: SELECT COUNT(*) as row_count FROM data
+
+Q: What's the average of sales column?
+A: SELECT AVG("sales") as avg_sales FROM data WHERE "sales" IS NOT NULL
+
+Q: Show me top 5 categories by count
+A: SELECT category, COUNT(*) as count FROM data WHERE category IS NOT NULL GROUP BY category ORDER BY count DESC LIMIT 5"""
+
+    return system_prompt
+
+
+# NL2SQL转换结果缓存: (规范化问题, schema键, 表名, 模型) -> SQL
+_SQL_CACHE: "OrderedDict[Tuple, str]" = OrderedDict()
+_SQL_CACHE_SIZE = 512
+
+# 进行中的转换: 相同的问题并发到达时共享同一次LLM调用
+_SQL_INFLIGHT: Dict[Tuple, "asyncio.Task[str]"] = {}
+# 每个进行中的转换仍在等待结果的调用方数量;最后一个调用方取消时取消LLM调用
+_SQL_WAITERS: Dict["asyncio.Task[str]", int] = {}
+
+
+def _normalize_question(question: str) -> str:
+    """合并问题中的连续空白,仅空白不同的问题共用缓存"""
+    return " ".join(question.split())
+
+
+def _clean_sql(reply: str) -> str:
+    """
+    从LLM回复中提取SQL
+
+    存在markdown代码块时只取代码块内容,并去掉首尾空白和末尾分号
+
+    Args:
+        reply: LLM回复文本
+
+    Returns:
+        SQL查询语句
+    """
+    match = SQL_CODE_BLOCK_PATTERN.search(reply)
+    if match:
+        reply = match.group(1)
+
+    sql_query = reply.strip()
+
+    # 移除末尾分号
+    if sql_query.endswith(";"):
+        sql_query = sql_query[:-1]
+
+    return sql_query
+
+
 class NL2SQLConverter:
     """
     自然语言转SQL转换器
@@ -148,43 +388,7 @@ class NL2SQLConverter:
         Returns:
             消息列表
         """
-        # 格式化schema信息
-        schema_str = "Table: {}\nColumns:\n".format(table_name)
-        for col in schema:
-            col_desc = f"- {col['name']} ({col['dtype']})"
-            if col.get('non_null_count'):
-                col_desc += f" - {col['non_null_count']} non-null values"
-            if col.get('unique_count'):
-                col_desc += f", {col['unique_count']} unique"
-            if col.get('min') is not None:
-                col_desc += f", range: [{col['min']:.2f}, {col['max']:.2f}]"
-            schema_str += col_desc + "\n"
-
-        # 构建系统提示
-        system_prompt = f"""You are an expert SQL query generator for DuckDB.
-
-Task: Convert natural language questions to SQL queries.
-
-{schema_str}
-
-Requirements:
-1. Generate ONLY the SQL query, no explanations
-2. Use double quotes for column names with spaces: "column name"
-3. Always use WHERE clause to filter NULL values when appropriate
-4. Use appropriate aggregation functions (COUNT, SUM, AVG, etc.)
-5. Add ORDER BY and LIMIT when relevant
-6. Return the query in a single line
-7. Do NOT include semicolon at the end
-
-Examples:
-Q: How many rows are there?
-A: SELECT COUNT(*) as row_count FROM data
-
-Q: What's the average of sales column?
-A: SELECT AVG("sales") as avg_sales FROM data WHERE "sales" IS NOT NULL
-
-Q: Show me top 5 categories by count
-A: SELECT category, COUNT(*) as count FROM data WHERE category IS NOT NULL GROUP BY category ORDER BY count DESC LIMIT 5"""
+        system_prompt = _nl2sql_system_prompt(_schema_key(schema), table_name)
 
         messages = [
             {"role": "system", "content": system_prompt}
@@ -210,6 +414,74 @@ A: SELECT category, COUNT(*) as count FROM data WHERE category IS NOT NULL GROUP
         """
         转换自然语言问题为SQL查询
 
+        Args:
+            question: 用户问题
+            schema: 数据表schema
+            table_name: 表名
+
+        Returns:
+            生成的SQL查询语句
+        """
+        # 同一数据集的相同问题 (如仪表盘自动刷新) 直接复用已生成的SQL
+        key = self._cache_key(question, schema, table_name)
+        cached = _SQL_CACHE.get(key)
+        if cached is not None:
+            _SQL_CACHE.move_to_end(key)
+            return cached
+
+        task = _SQL_INFLIGHT.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(self._generate_sql(question, schema, table_name))
+            _SQL_INFLIGHT[key] = task
+            task.add_done_callback(lambda t: self._store_result(key, t))
+
+        # shield: 单个调用方取消 (如客户端断开) 不影响共享同一调用的其他请求;
+        # 所有调用方都已取消时没有人再需要结果,取消LLM调用
+        _SQL_WAITERS[task] = _SQL_WAITERS.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            waiters = _SQL_WAITERS.pop(task) - 1
+            if waiters:
+                _SQL_WAITERS[task] = waiters
+            elif not task.done():
+                # 先移出进行中列表,随后到达的相同问题发起新的调用而不是等待已取消的任务
+                if _SQL_INFLIGHT.get(key) is task:
+                    del _SQL_INFLIGHT[key]
+                task.cancel()
+
+    def _cache_key(self, question: str, schema: List[Dict[str, Any]], table_name: str) -> Tuple:
+        """SQL缓存键: 规范化问题、schema、表名和所用模型"""
+        return (
+            _normalize_question(question),
+            _schema_key(schema),
+            table_name,
+            self.llm_client.base_url,
+            self.llm_client.model_name
+        )
+
+    @staticmethod
+    def _store_result(key: Tuple, task: "asyncio.Task[str]") -> None:
+        """LLM调用结束后写入缓存 (失败或取消的结果不缓存)"""
+        if _SQL_INFLIGHT.get(key) is task:
+            del _SQL_INFLIGHT[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        sql_query = task.result()
+        if sql_query:
+            _SQL_CACHE[key] = sql_query
+            if len(_SQL_CACHE) > _SQL_CACHE_SIZE:
+                _SQL_CACHE.popitem(last=False)
+
+    async def _generate_sql(
+        self,
+        question: str,
+        schema: List[Dict[str, Any]],
+        table_name: str
+    ) -> str:
+        """
+        调用LLM生成SQL并清理回复
+
         Args:
             question: 用户问题
             schema: 数据表schema
@@ -220,30 +492,76 @@ A: SELECT category, COUNT(*) as count FROM data WHERE category IS NOT NULL GROUP
         """
         messages = self.build_nl2sql_prompt(question, schema, table_name)
 
-        sql_query = await self.llm_client.extract_content(
+        reply = await self.llm_client.extract_content(
             messages,
             temperature=0.1,  # 低温度保证确定性
             max_tokens=500
         )
+        return _clean_sql(reply)
+
+    async def repair(
+        self,
+        question: str,
+        schema: List[Dict[str, Any]],
+        sql_query: str,
+        error: str,
+        table_name: str = "data"
+    ) -> str:
+        """
+        根据数据库报错让LLM修正生成的SQL
+
+        在原提示词后追加上一次生成的SQL和报错信息,在同一请求内完成修正;
+        修正结果写入缓存,执行仍然失败时由调用方 invalidate
+
+        Args:
+            question: 用户问题
+            schema: 数据表schema
+            sql_query: 执行失败的SQL
+            error: 数据库返回的错误信息
+            table_name: 表名
+
+        Returns:
+            修正后的SQL查询语句
+        """
+        messages = self.build_nl2sql_prompt(question, schema, table_name)
+        messages.append({"role": "assistant", "content": sql_query})
+        messages.append({
+            "role": "user",
+            "content": f"That SQL failed with error: {error}\nReturn only the corrected SQL query."
+        })
 
-        # 清理SQL查询
-        sql_query = sql_query.strip()
+        reply = await self.llm_client.extract_content(
+            messages,
+            temperature=0.1,
+            max_tokens=500
+        )
+        fixed_sql = _clean_sql(reply)
 
-        # 移除可能的markdown代码块标记
-        if sql_query.startswith("```sql"):
-            sql_query = sql_query[6:]
-        if sql_query.startswith("```"):
-            sql_query = sql_query[3:]
-        if sql_query.endswith("```"):
-            sql_query = sql_query[:-3]
+        if fixed_sql:
+            key = self._cache_key(question, schema, table_name)
+            _SQL_CACHE[key] = fixed_sql
+            _SQL_CACHE.move_to_end(key)
+            if len(_SQL_CACHE) > _SQL_CACHE_SIZE:
+                _SQL_CACHE.popitem(last=False)
+        return fixed_sql
 
-        sql_query = sql_query.strip()
+    def invalidate(
+        self,
+        question: str,
+        schema: List[Dict[str, Any]],
+        table_name: str = "data"
+    ) -> None:
+        """
+        从缓存中移除问题对应的SQL
 
-        # 移除末尾分号
-        if sql_query.endswith(";"):
-            sql_query = sql_query[:-1]
+        生成的SQL执行失败时调用,相同问题下次重新生成,而不是一直拿到出错的SQL
 
-        return sql_query
+        Args:
+            question: 用户问题
+            schema: 数据表schema
+            table_name: 表名
+        """
+        _SQL_CACHE.pop(self._cache_key(question, schema, table_name), None)
 
 
 class QueryExplainer:
@@ -261,15 +579,15 @@ class QueryExplainer:
         """
         self.llm_client = llm_client or LLMClient()
 
-    async def explain_results(
+    def build_explain_prompt(
         self,
         question: str,
         sql_query: str,
         results: List[Dict[str, Any]],
         max_rows_to_show: int = 10
-    ) -> str:
+    ) -> List[Dict[str, str]]:
         """
-        解释查询结果
+        构建结果解释提示词
 
         Args:
             question: 原始问题
@@ -278,13 +596,13 @@ class QueryExplainer:
             max_rows_to_show: 最多显示的行数
 
         Returns:
-            自然语言解释
+            消息列表
         """
         # 限制结果行数
         results_preview = results[:max_rows_to_show]
 
-        # 格式化结果
-        results_str = json.dumps(results_preview, indent=2, ensure_ascii=False)
+        # 格式化结果 (orjson 直接输出 UTF-8,非 JSON 原生类型按字符串输出)
+        results_str = orjson.dumps(results_preview, option=orjson.OPT_INDENT_2, default=str).decode()
         if len(results) > max_rows_to_show:
             results_str += f"\n... ({len(results) - max_rows_to_show} more rows)"
 
@@ -307,10 +625,31 @@ Response format:
 - Include key numbers and insights
 - Keep it conversational and easy to understand"""
 
-        messages = [
+        return [
             {"role": "user", "content": prompt}
         ]
 
+    async def explain_results(
+        self,
+        question: str,
+        sql_query: str,
+        results: List[Dict[str, Any]],
+        max_rows_to_show: int = 10
+    ) -> str:
+        """
+        解释查询结果
+
+        Args:
+            question: 原始问题
+            sql_query: 执行的SQL查询
+            results: 查询结果 (字典列表)
+            max_rows_to_show: 最多显示的行数
+
+        Returns:
+            自然语言解释
+        """
+        messages = self.build_explain_prompt(question, sql_query, results, max_rows_to_show)
+
         explanation = await self.llm_client.extract_content(
             messages,
             temperature=0.3,
@@ -319,6 +658,34 @@ Response format:
 
         return explanation.strip()
 
+    async def explain_results_stream(
+        self,
+        question: str,
+        sql_query: str,
+        results: List[Dict[str, Any]],
+        max_rows_to_show: int = 10
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式解释查询结果,生成的文本片段可直接转发给前端
+
+        Args:
+            question: 原始问题
+            sql_query: 执行的SQL查询
+            results: 查询结果 (字典列表)
+            max_rows_to_show: 最多显示的行数
+
+        Yields:
+            自然语言解释的文本片段
+        """
+        messages = self.build_explain_prompt(question, sql_query, results, max_rows_to_show)
+
+        async for chunk in self.llm_client.chat_completion_stream(
+            messages,
+            temperature=0.3,
+            max_tokens=300
+        ):
+            yield chunk
+
 
 # 创建全局实例 (可选)
 def get_llm_client() -> LLMClient:
@@ -4,11 +4,56 @@ SQL查询工具集
 """
 
 import duckdb
-from typing import List, Dict, Any, Optional, Tuple
-from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
 import pandas as pd
+import os
 import re
-from datetime import datetime
+import threading
+import time
+from functools import lru_cache
+
+from backend.utils.duckdb_cache import get_cursor
+
+
+# 时间戳的ISO 8601格式;秒的小数部分为0时去掉,与 datetime.isoformat() 输出一致
+ISO_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+ZERO_FRACTION_PATTERN = r'\.0+(\+|-|$)'
+
+# 查询结果分批读取的行数
+FETCH_BATCH_SIZE = 2048
+
+
+def _json_ready_column(column: pa.Array) -> pa.Array:
+    """
+    用Arrow计算函数把一列转换为可直接JSON序列化的类型
+
+    - 时间戳/日期: ISO 8601 字符串 (带时区的时间戳附加 +HH:MM 偏移)
+    - 时间: 字符串
+    - DECIMAL/HUGEINT: float
+    - 浮点 NaN: None
+
+    Args:
+        column: 查询结果的一列 (Array 或 ChunkedArray)
+
+    Returns:
+        转换后的列
+    """
+    column_type = column.type
+    if pa.types.is_timestamp(column_type) or pa.types.is_date(column_type):
+        fmt = ISO_TIMESTAMP_FORMAT + '%Ez' if getattr(column_type, 'tz', None) else ISO_TIMESTAMP_FORMAT
+        formatted = pc.strftime(column, format=fmt)
+        return pc.replace_substring_regex(formatted, pattern=ZERO_FRACTION_PATTERN, replacement=r'\1')
+    if pa.types.is_time(column_type):
+        formatted = pc.cast(column, pa.string())
+        return pc.replace_substring_regex(formatted, pattern=ZERO_FRACTION_PATTERN, replacement=r'\1')
+    if pa.types.is_decimal(column_type):
+        return pc.cast(column, pa.float64())
+    if pa.types.is_floating(column_type):
+        return pc.if_else(pc.is_nan(column), pa.scalar(None, column_type), column)
+    return column
 
 
 class SQLExecutor:
@@ -33,6 +78,14 @@ class SQLExecutor:
         'TRUNCATE', 'REPLACE', 'MERGE', 'EXECUTE', 'EXEC'
     }
 
+    # 黑名单关键字预编译为单个正则,每次验证只扫描一遍SQL
+    FORBIDDEN_SQL_PATTERN = re.compile(
+        r'\b(' + '|'.join(sorted(FORBIDDEN_SQL_KEYWORDS)) + r')\b', re.IGNORECASE
+    )
+
+    # 只允许以 SELECT / WITH 开头的查询
+    SELECT_PREFIX_PATTERN = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
     def __init__(self, file_path: str, table_name: str = "data"):
         """
         初始化SQL执行器
@@ -43,7 +96,12 @@ class SQLExecutor:
         """
         self.file_path = file_path
         self.table_name = table_name
+        # 表名作为SQL标识符引用一次,之后的语句直接拼接引用后的名称
+        self._quoted_table = '"' + table_name.replace('"', '""') + '"'
         self.conn = None
+        self._interrupted = False
+        # 游标按线程复用,close 之后不能再中断它 (可能已在执行同一线程的其他查询)
+        self._conn_lock = threading.Lock()
 
     def __enter__(self):
         """上下文管理器入口"""
@@ -55,62 +113,32 @@ class SQLExecutor:
         self.close()
 
     def _connect(self):
-        """建立DuckDB连接并加载数据"""
+        """获取已加载数据的DuckDB游标 (数据表按文件版本缓存,仅首次加载时解析文件)"""
         if self.conn:
             return
 
-        self.conn = duckdb.connect(':memory:')
-
-        # 根据文件类型加载数据
-        file_ext = Path(self.file_path).suffix.lower()
-
         try:
-            if file_ext == '.csv':
-                self.conn.execute(
-                    f"CREATE TABLE {self.table_name} AS SELECT * FROM read_csv_auto('{self.file_path}')"
-                )
-            elif file_ext in ['.xlsx', '.xls']:
-                # Excel文件:先用openpyxl读取,再导入DuckDB
-                import openpyxl
-                import csv
-                import tempfile
-
-                wb = openpyxl.load_workbook(self.file_path, read_only=True)
-                ws = wb.active
-
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp:
-                    csv_writer = csv.writer(tmp)
-                    for row in ws.iter_rows(values_only=True):
-                        csv_writer.writerow(row)
-                    tmp_path = tmp.name
-
-                self.conn.execute(
-                    f"CREATE TABLE {self.table_name} AS SELECT * FROM read_csv_auto('{tmp_path}')"
-                )
-                Path(tmp_path).unlink()
-                wb.close()
-
-            elif file_ext == '.json':
-                self.conn.execute(
-                    f"CREATE TABLE {self.table_name} AS SELECT * FROM read_json_auto('{self.file_path}')"
-                )
-            elif file_ext == '.parquet':
-                self.conn.execute(
-                    f"CREATE TABLE {self.table_name} AS SELECT * FROM read_parquet('{self.file_path}')"
-                )
-            else:
-                raise ValueError(f"Unsupported file type: {file_ext}")
-
+            mtime = os.path.getmtime(self.file_path)
+            # 与图表共用按文件版本缓存的连接;每个线程使用自己的游标,多个线程可并发查询同一份缓存数据
+            self.conn = get_cursor(self.file_path, mtime, self.table_name)
         except Exception as e:
-            if self.conn:
-                self.conn.close()
-                self.conn = None
             raise RuntimeError(f"Failed to load data: {str(e)}")
 
+    def interrupt(self):
+        """
+        中断正在执行的查询 (可从其他线程调用)
+
+        DuckDB 在执行线程中抛出 InterruptException,execute 返回失败结果;
+        调用时尚未开始的查询不再执行
+        """
+        self._interrupted = True
+        with self._conn_lock:
+            if self.conn:
+                self.conn.interrupt()
+
     def close(self):
-        """关闭DuckDB连接"""
-        if self.conn:
-            self.conn.close()
+        """释放游标 (游标和缓存的连接保持打开,供当前线程的后续查询复用)"""
+        with self._conn_lock:
             self.conn = None
 
     def validate_sql(self, sql: str) -> Tuple[bool, Optional[str]]:
@@ -128,15 +156,13 @@ class SQLExecutor:
         Returns:
             (is_valid, error_message)
         """
-        sql_upper = sql.upper()
-
-        # 检查危险关键字
-        for keyword in self.FORBIDDEN_SQL_KEYWORDS:
-            if re.search(rf'\b{keyword}\b', sql_upper):
-                return False, f"Forbidden SQL keyword detected: {keyword}"
+        # 检查危险关键字 (正则忽略大小写,无需复制整条SQL做大写转换)
+        match = self.FORBIDDEN_SQL_PATTERN.search(sql)
+        if match:
+            return False, f"Forbidden SQL keyword detected: {match.group(1).upper()}"
 
         # 检查是否以SELECT开头
-        if not sql_upper.strip().startswith('SELECT') and not sql_upper.strip().startswith('WITH'):
+        if not self.SELECT_PREFIX_PATTERN.match(sql):
             return False, "Only SELECT queries are allowed"
 
         # 检查是否包含多个语句 (基本防护)
@@ -182,39 +208,43 @@ class SQLExecutor:
         if not self.conn:
             self._connect()
 
-        try:
-            start_time = datetime.now()
+        if self._interrupted:
+            return {
+                "success": False,
+                "error": "Query interrupted",
+                "sql": sql
+            }
 
-            # 添加LIMIT限制 (如果没有)
-            sql_with_limit = sql.strip()
-            if not re.search(r'\bLIMIT\b', sql_with_limit, re.IGNORECASE):
-                sql_with_limit += f" LIMIT {max_rows}"
+        try:
+            start_time = time.perf_counter()
 
-            # 执行查询
-            result = self.conn.execute(sql_with_limit).fetchdf()
+            # 外层包一层绑定参数的LIMIT: 不需要在SQL文本中查找LIMIT,内层更小的LIMIT由优化器合并;
+            # 子查询前后换行,避免SQL末尾的行注释吞掉右括号
+            query = sql.strip().rstrip(';')
+            sql_with_limit = f"SELECT * FROM (\n{query}\n) AS _q LIMIT ?"
 
-            execution_time = (datetime.now() - start_time).total_seconds()
+            # 执行查询,结果分批流式读取: 每批转换后即可释放,不同时持有完整的Arrow结果
+            reader = self.conn.execute(sql_with_limit, [max_rows]).fetch_record_batch(FETCH_BATCH_SIZE)
+            # 子查询中的重复列名已由DuckDB重命名 (a, a:1)
+            columns = reader.schema.names
 
-            # 转换为字典列表
-            data = result.to_dict('records')
+            # 特殊类型 (时间戳、DECIMAL、NaN) 按列用Arrow计算函数转换,再整批转为字典列表
+            data = []
+            for batch in reader:
+                data.extend(pa.RecordBatch.from_arrays(
+                    [_json_ready_column(column) for column in batch.columns],
+                    names=columns
+                ).to_pylist())
 
-            # 处理特殊类型 (datetime, etc.)
-            for row in data:
-                for key, value in row.items():
-                    if pd.isna(value):
-                        row[key] = None
-                    elif isinstance(value, (pd.Timestamp, datetime)):
-                        row[key] = value.isoformat()
-                    elif isinstance(value, (int, float)) and pd.isna(value):
-                        row[key] = None
+            execution_time = time.perf_counter() - start_time
 
             return {
                 "success": True,
                 "data": data,
-                "columns": result.columns.tolist(),
+                "columns": columns,
                 "row_count": len(data),
                 "execution_time": execution_time,
-                "sql": sql_with_limit
+                "sql": sql
             }
 
         except Exception as e:
@@ -235,28 +265,103 @@ class SQLExecutor:
             self._connect()
 
         try:
-            schema_df = self.conn.execute(f"DESCRIBE {self.table_name}").fetchdf()
-            return [
-                {"name": row["column_name"], "type": row["column_type"]}
-                for _, row in schema_df.iterrows()
-            ]
+            # DESCRIBE <表名> 在 DuckDB 0.9 中无法解析含转义引号的标识符,改为描述查询;
+            # 结果行以 (column_name, column_type, ...) 开头
+            rows = self.conn.execute(f"DESCRIBE SELECT * FROM {self._quoted_table}").fetchall()
+            return [{"name": row[0], "type": row[1]} for row in rows]
         except Exception as e:
             raise RuntimeError(f"Failed to get schema: {str(e)}")
 
-    def get_sample_data(self, limit: int = 5) -> pd.DataFrame:
+    def get_sample_data(self, limit: int = 5, as_arrow: bool = False) -> Union[pd.DataFrame, pa.Table]:
         """
         获取样本数据
 
         Args:
             limit: 样本行数
+            as_arrow: 是否返回Arrow表 (不构建pandas对象列,可直接传给 QueryResultFormatter.to_markdown_table)
 
         Returns:
-            DataFrame样本数据
+            DataFrame样本数据 (as_arrow=True 时为Arrow表)
         """
         if not self.conn:
             self._connect()
 
-        return self.conn.execute(f"SELECT * FROM {self.table_name} LIMIT {limit}").fetchdf()
+        result = self.conn.execute(f"SELECT * FROM {self._quoted_table} LIMIT ?", [limit])
+        return result.fetch_arrow_table() if as_arrow else result.fetchdf()
+
+    def summarize(self, sql: str, exact_unique: bool = False) -> Dict[str, Any]:
+        """
+        在DuckDB中一次聚合生成查询结果的列摘要
+
+        与 QueryResultFormatter.to_summary 输出结构相同,但统计的是完整查询结果,
+        不需要先取回数据再构建DataFrame;所有列的统计在同一条聚合语句中完成
+
+        Args:
+            sql: SQL查询语句
+            exact_unique: 是否精确计算唯一值数量 (默认使用 approx_count_distinct 近似计算)
+
+        Returns:
+            摘要字典
+
+        Raises:
+            ValueError: SQL未通过安全验证
+        """
+        is_valid, error_msg = self.validate_sql(sql)
+        if not is_valid:
+            raise ValueError(error_msg)
+
+        if not self.conn:
+            self._connect()
+
+        query = sql.strip().rstrip(';')
+        # DESCRIBE 行以 (column_name, column_type, ...) 开头
+        schema = [
+            (row[0], row[1])
+            for row in self.conn.execute(f"DESCRIBE SELECT * FROM ({query}) AS q").fetchall()
+        ]
+        numeric_columns = set(_numeric_columns_cached(tuple(schema)))
+
+        unique_func = "COUNT(DISTINCT {})" if exact_unique else "approx_count_distinct({})"
+        select_items = ["COUNT(*)"]
+        for name, _ in schema:
+            col = '"' + name.replace('"', '""') + '"'
+            select_items += [f"COUNT({col})", unique_func.format(col)]
+            if name in numeric_columns:
+                select_items += [
+                    f"MIN({col})::DOUBLE", f"MAX({col})::DOUBLE",
+                    f"AVG({col})::DOUBLE", f"MEDIAN({col})::DOUBLE"
+                ]
+
+        row = self.conn.execute(
+            f"WITH q AS ({query}) SELECT {', '.join(select_items)} FROM q"
+        ).fetchone()
+
+        row_count = row[0]
+        values = iter(row[1:])
+        column_stats = {}
+        for name, dtype in schema:
+            non_null_count = next(values)
+            stats = {
+                "dtype": dtype,
+                "non_null_count": non_null_count,
+                "null_count": row_count - non_null_count,
+                "unique_count": next(values)
+            }
+            if name in numeric_columns:
+                stats.update({
+                    "min": next(values),
+                    "max": next(values),
+                    "mean": next(values),
+                    "median": next(values)
+                })
+            column_stats[name] = stats
+
+        return {
+            "row_count": row_count,
+            "column_count": len(schema),
+            "columns": [name for name, _ in schema],
+            "column_stats": column_stats
+        }
 
 
 class QueryResultFormatter:
@@ -267,7 +372,7 @@ class QueryResultFormatter:
 
     @staticmethod
     def to_markdown_table(
-        data: List[Dict[str, Any]],
+        data: Union[List[Dict[str, Any]], pa.Table],
         columns: Optional[List[str]] = None,
         max_rows: int = 20
     ) -> str:
@@ -275,7 +380,7 @@ class QueryResultFormatter:
         转换为Markdown表格
 
         Args:
-            data: 查询结果数据
+            data: 查询结果数据 (字典列表或Arrow表)
             columns: 列名列表 (可选,从数据推断)
             max_rows: 最大显示行数
 
@@ -285,27 +390,34 @@ class QueryResultFormatter:
         if not data:
             return "*No results*"
 
+        is_arrow = isinstance(data, pa.Table)
+
         # 推断列名
         if columns is None:
-            columns = list(data[0].keys())
-
-        # 限制行数
-        display_data = data[:max_rows]
+            columns = data.column_names if is_arrow else list(data[0].keys())
+
+        # 限制行数并按列顺序取出每行的值
+        if is_arrow:
+            # Arrow表: 每列一次性转为Python列表,再按位置组合成行,不做逐个单元格的字典查找
+            display_table = data.slice(0, max_rows)
+            available = set(display_table.column_names)
+            row_values = zip(*(
+                display_table.column(col).to_pylist() if col in available
+                else [""] * display_table.num_rows
+                for col in columns
+            ))
+        else:
+            row_values = ([row.get(col, "") for col in columns] for row in data[:max_rows])
 
         # 构建表头
         header = "| " + " | ".join(columns) + " |"
         separator = "| " + " | ".join(["---"] * len(columns)) + " |"
 
-        # 构建数据行
-        rows = []
-        for row in display_data:
-            row_str = "| " + " | ".join(
-                str(row.get(col, "")) for col in columns
-            ) + " |"
-            rows.append(row_str)
+        # 构建数据行: 每行一次 join
+        rows = ("| " + " | ".join(map(str, values)) + " |" for values in row_values)
 
         # 组合
-        table = "\n".join([header, separator] + rows)
+        table = "\n".join([header, separator, *rows])
 
         # 添加省略提示
         if len(data) > max_rows:
@@ -358,24 +470,88 @@ class QueryResultFormatter:
                 "unique_count": int(col_data.nunique())
             }
 
-            # 如果是数值类型,添加统计信息
+            # 如果是数值类型,添加统计信息: 取底层数组并去掉缺失值一次,再用numpy归约
             if pd.api.types.is_numeric_dtype(col_data):
-                stats.update({
-                    "min": float(col_data.min()) if not col_data.empty else None,
-                    "max": float(col_data.max()) if not col_data.empty else None,
-                    "mean": float(col_data.mean()) if not col_data.empty else None,
-                    "median": float(col_data.median()) if not col_data.empty else None
-                })
+                values = col_data.to_numpy(dtype=float, na_value=np.nan)
+                values = values[~np.isnan(values)]
+                if values.size:
+                    stats.update({
+                        "min": float(values.min()),
+                        "max": float(values.max()),
+                        "mean": float(values.mean()),
+                        "median": float(np.median(values))
+                    })
+                else:
+                    stats.update({"min": None, "max": None, "mean": None, "median": None})
 
             summary["column_stats"][col] = stats
 
         return summary
 
 
+# 数值类型名称,用于从 DuckDB 类型字符串中识别数值列
+NUMERIC_TYPE_NAMES = ('BIGINT', 'INTEGER', 'SMALLINT', 'TINYINT',
+                      'DOUBLE', 'FLOAT', 'DECIMAL', 'NUMERIC', 'HUGEINT')
+
+# 整个类型名匹配数值类型才视为数值列: 允许无符号前缀和精度 (如 UBIGINT、DECIMAL(10,2)),
+# BIGINT[]、STRUCT(a INTEGER) 等复合类型不算数值列
+NUMERIC_TYPE_PATTERN = re.compile(
+    r'U?(?:' + '|'.join(NUMERIC_TYPE_NAMES) + r')(?:\(\d+,\s*\d+\))?', re.IGNORECASE
+)
+
+
+def _column_key(schema_json: List[Dict[str, Any]]) -> Tuple[Tuple[str, str], ...]:
+    """由列名和类型构成的可哈希缓存键"""
+    return tuple((col['name'], col['dtype']) for col in schema_json)
+
+
+def _llm_format_key(schema_json: List[Dict[str, Any]]) -> Tuple[tuple, ...]:
+    """包含 LLM 格式化所用统计信息的可哈希缓存键"""
+    return tuple(
+        (col['name'], col['dtype'], col.get('non_null_count'),
+         col.get('unique_count'), col.get('min'), col.get('max'))
+        for col in schema_json
+    )
+
+
+@lru_cache(maxsize=128)
+def _column_names_cached(column_key: Tuple[Tuple[str, str], ...]) -> Tuple[str, ...]:
+    return tuple(name for name, _ in column_key)
+
+
+@lru_cache(maxsize=128)
+def _numeric_columns_cached(column_key: Tuple[Tuple[str, str], ...]) -> Tuple[str, ...]:
+    return tuple(
+        name for name, dtype in column_key
+        if NUMERIC_TYPE_PATTERN.fullmatch(dtype.strip())
+    )
+
+
+@lru_cache(maxsize=128)
+def _llm_format_cached(format_key: Tuple[tuple, ...]) -> str:
+    lines = []
+    for name, dtype, non_null_count, unique_count, min_value, max_value in format_key:
+        parts = [f"- {name} ({dtype})"]
+
+        # 添加统计信息
+        if non_null_count:
+            parts.append(f" - {non_null_count} non-null")
+        if unique_count:
+            parts.append(f", {unique_count} unique")
+        if min_value is not None and max_value is not None:
+            parts.append(f", range: [{min_value}, {max_value}]")
+
+        lines.append("".join(parts))
+
+    return "\n".join(lines)
+
+
 class SchemaRetriever:
     """
     Schema检索器
     从Dataset模型中获取schema信息供LLM使用
+
+    派生结果按 schema 内容缓存,相同 schema 重复调用只需一次字典查找
     """
 
     @staticmethod
@@ -392,21 +568,7 @@ class SchemaRetriever:
         if not schema_json:
             return "No schema available"
 
-        lines = []
-        for col in schema_json:
-            line = f"- {col['name']} ({col['dtype']})"
-
-            # 添加统计信息
-            if col.get('non_null_count'):
-                line += f" - {col['non_null_count']} non-null"
-            if col.get('unique_count'):
-                line += f", {col['unique_count']} unique"
-            if col.get('min') is not None and col.get('max') is not None:
-                line += f", range: [{col['min']}, {col['max']}]"
-
-            lines.append(line)
-
-        return "\n".join(lines)
+        return _llm_format_cached(_llm_format_key(schema_json))
 
     @staticmethod
     def get_column_names(schema_json: List[Dict[str, Any]]) -> List[str]:
@@ -419,7 +581,7 @@ class SchemaRetriever:
         Returns:
             列名列表
         """
-        return [col['name'] for col in schema_json]
+        return list(_column_names_cached(_column_key(schema_json)))
 
     @staticmethod
     def get_numeric_columns(schema_json: List[Dict[str, Any]]) -> List[str]:
@@ -432,12 +594,4 @@ class SchemaRetriever:
         Returns:
             数值列名列表
         """
-        numeric_types = ['BIGINT', 'INTEGER', 'SMALLINT', 'TINYINT',
-                        'DOUBLE', 'FLOAT', 'DECIMAL', 'NUMERIC', 'HUGEINT']
-
-        numeric_cols = []
-        for col in schema_json:
-            if any(num_type in col['dtype'].upper() for num_type in numeric_types):
-                numeric_cols.append(col['name'])
-
-        return numeric_cols
+        return list(_numeric_columns_cached(_column_key(schema_json)))